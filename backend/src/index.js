@@ -93,8 +93,46 @@ function authenticateToken(req, res, next) {
   });
 }
 
+// Like authenticateToken, but anonymous requests pass through without req.user
+function optionalToken(req, res, next) {
+  const auth = req.headers.authorization;
+  const token = auth && auth.split(' ')[1];
+  if (!token) return next();
+  jwt.verify(token, process.env.JWT_SECRET || 'changeme', (err, user) => {
+    if (!err) req.user = user;
+    next();
+  });
+}
+
 // 🔧 External services
 const ML_SERVICE_URL = process.env.ML_SERVICE_URL || 'http://ml_service';
+// Embeddings from the ML service are JSON float arrays by default, or compact base64 payloads
+// ({ encoding: 'f32' | 'f16' | 'i8', dim, data, scale }) when requested; see ml_service/embedding_codec.py.
+// Returns a plain array either way (or the input unchanged when it is neither form).
+function halfToFloat(h) {
+  const exp = (h >> 10) & 0x1f;
+  const frac = h & 0x3ff;
+  const sign = h & 0x8000 ? -1 : 1;
+  if (exp === 0) return sign * Math.pow(2, -14) * (frac / 1024);
+  if (exp === 31) return frac ? NaN : sign * Infinity;
+  return sign * Math.pow(2, exp - 15) * (1 + frac / 1024);
+}
+function decodeEmbedding(value) {
+  if (!value || Array.isArray(value) || typeof value.data !== 'string') return value;
+  const buf = Buffer.from(value.data, 'base64');
+  let out;
+  if (value.encoding === 'f32') {
+    out = Array.from({ length: buf.length / 4 }, (_, i) => buf.readFloatLE(i * 4));
+  } else if (value.encoding === 'f16') {
+    out = Array.from({ length: buf.length / 2 }, (_, i) => halfToFloat(buf.readUInt16LE(i * 2)));
+  } else if (value.encoding === 'i8') {
+    out = Array.from({ length: buf.length }, (_, i) => buf.readInt8(i) * value.scale);
+  } else {
+    return value;
+  }
+  return out;
+}
+
 // Optional semantic similarity gate; set SEMANTIC_MIN_SIMILARITY env to enable (e.g., 0.12)
 const SEMANTIC_MIN_SIMILARITY = Number.isFinite(parseFloat(process.env.SEMANTIC_MIN_SIMILARITY))
   ? parseFloat(process.env.SEMANTIC_MIN_SIMILARITY)
@@ -158,7 +196,7 @@ app.post('/api/login', loginLimiter, async (req, res) => {
 
 // 🧠 OCR
 const ocrLimiter = rateLimit({ windowMs: 60 * 1000, max: 30 });
-app.post('/api/ocr', ocrLimiter, upload.single('file'), async (req, res) => {
+app.post('/api/ocr', ocrLimiter, optionalToken, upload.single('file'), async (req, res) => {
   try {
     if (!req.file) return res.status(400).json({ error: 'No file uploaded' });
 
@@ -167,6 +205,14 @@ app.post('/api/ocr', ocrLimiter, upload.single('file'), async (req, res) => {
 
     const formData = new FormData();
     formData.append('file', fs.createReadStream(filePath));
+    // Optional caption quality tier: 'fast' | 'full' | 'auto'
+    if (req.body?.tier) formData.append('tier', String(req.body.tier));
+    // Optional per-stage timing breakdown in the response
+    if (req.body?.timings) formData.append('timings', String(req.body.timings));
+    // Optional compact embedding encoding: 'f32' | 'f16' | 'i8' (default: JSON array)
+    if (req.body?.embedding_encoding) formData.append('embedding_encoding', String(req.body.embedding_encoding));
+    // Duplicate detection only matches earlier uploads of the same organization
+    if (req.user?.organization_id != null) formData.append('organization_id', String(req.user.organization_id));
 
     const response = await axios.post(`${ML_SERVICE_URL}/ocr`, formData, {
       headers: formData.getHeaders(),
@@ -189,6 +235,133 @@ app.post('/api/ocr', ocrLimiter, upload.single('file'), async (req, res) => {
   }
 });
 
+// 🧠 Bulk OCR: forwards all photos in one ML call and streams NDJSON results as items complete
+app.post('/api/ocr/batch', ocrLimiter, optionalToken, upload.array('files', 50), async (req, res) => {
+  if (!req.files || req.files.length === 0) return res.status(400).json({ error: 'No files uploaded' });
+
+  try {
+    const formData = new FormData();
+    for (const f of req.files) {
+      formData.append('files', fs.createReadStream(f.path), { filename: f.originalname });
+    }
+    if (req.body?.tier) formData.append('tier', String(req.body.tier));
+    if (req.body?.timings) formData.append('timings', String(req.body.timings));
+    if (req.body?.embedding_encoding) formData.append('embedding_encoding', String(req.body.embedding_encoding));
+    if (req.user?.organization_id != null) formData.append('organization_id', String(req.user.organization_id));
+
+    const response = await axios.post(`${ML_SERVICE_URL}/ocr/batch`, formData, {
+      headers: formData.getHeaders(),
+      responseType: 'stream',
+      timeout: 120000 + req.files.length * 15000
+    });
+
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    let buffered = '';
+    const writeLine = (line) => {
+      if (!line.trim()) return;
+      try {
+        const item = JSON.parse(line);
+        const saved = req.files[item.index];
+        res.write(JSON.stringify({ ...item, filename: saved ? saved.filename : item.filename }) + '\n');
+      } catch (e) {
+        console.warn('[OCR Batch Parse Error]', e.message);
+      }
+    };
+    response.data.on('data', (chunk) => {
+      buffered += chunk.toString('utf8');
+      let nl;
+      while ((nl = buffered.indexOf('\n')) >= 0) {
+        writeLine(buffered.slice(0, nl));
+        buffered = buffered.slice(nl + 1);
+      }
+    });
+    response.data.on('end', () => {
+      writeLine(buffered);
+      res.end();
+    });
+    response.data.on('error', (e) => {
+      console.error('[OCR Batch Stream Error]', e.message);
+      res.end();
+    });
+  } catch (err) {
+    const info = {
+      message: err.message,
+      code: err.code,
+      response_status: err.response?.status,
+    };
+    console.error('[OCR Batch Error]', info);
+    res.status(502).json({ error: 'ML service unavailable', details: info });
+  }
+});
+
+// ⏱️ Asynchronous OCR: returns a job id at once; fields arrive by polling or server-sent events
+app.post('/api/ocr/jobs', ocrLimiter, optionalToken, upload.single('file'), async (req, res) => {
+  if (!req.file) return res.status(400).json({ error: 'No file uploaded' });
+  try {
+    const formData = new FormData();
+    formData.append('file', fs.createReadStream(req.file.path));
+    if (req.body?.tier) formData.append('tier', String(req.body.tier));
+    if (req.body?.timings) formData.append('timings', String(req.body.timings));
+    if (req.body?.embedding_encoding) formData.append('embedding_encoding', String(req.body.embedding_encoding));
+    if (req.user?.organization_id != null) formData.append('organization_id', String(req.user.organization_id));
+
+    const response = await axios.post(`${ML_SERVICE_URL}/jobs/ocr`, formData, {
+      headers: formData.getHeaders(),
+      timeout: 15000,
+      validateStatus: s => s < 500
+    });
+    if (response.status !== 202 && response.status !== 200) return res.status(response.status).json(response.data);
+    const jobId = response.data.job_id;
+    res.status(202).json({
+      job_id: jobId,
+      status: response.data.status,
+      filename: req.file.filename,
+      status_url: `/api/ocr/jobs/${jobId}`,
+      events_url: `/api/ocr/jobs/${jobId}/events`
+    });
+  } catch (err) {
+    console.error('[OCR Job Error]', err?.message || err);
+    res.status(502).json({ error: 'ML service unavailable', details: err?.message });
+  }
+});
+
+app.get('/api/ocr/jobs/:id', async (req, res) => {
+  try {
+    const response = await axios.get(`${ML_SERVICE_URL}/jobs/${encodeURIComponent(req.params.id)}`, {
+      timeout: 5000,
+      validateStatus: s => s < 500
+    });
+    res.status(response.status).json(response.data);
+  } catch (err) {
+    res.status(502).json({ error: 'ML service unavailable', details: err?.message });
+  }
+});
+
+app.get('/api/ocr/jobs/:id/events', async (req, res) => {
+  try {
+    const headers = {};
+    if (req.get('Last-Event-ID')) headers['Last-Event-ID'] = req.get('Last-Event-ID');
+    const response = await axios.get(`${ML_SERVICE_URL}/jobs/${encodeURIComponent(req.params.id)}/events`, {
+      headers,
+      responseType: 'stream',
+      timeout: 0,
+      validateStatus: s => s < 500
+    });
+    if (response.status !== 200) {
+      res.status(response.status);
+      return response.data.pipe(res);
+    }
+    res.setHeader('Content-Type', 'text/event-stream');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.setHeader('X-Accel-Buffering', 'no');  // let nginx pass events through unbuffered
+    res.flushHeaders();
+    response.data.pipe(res);
+    req.on('close', () => response.data.destroy());
+  } catch (err) {
+    if (!res.headersSent) res.status(502).json({ error: 'ML service unavailable', details: err?.message });
+  }
+});
+
 // Health check to verify ml_service availability from backend
 app.get('/api/ml/health', async (_req, res) => {
   try {
@@ -281,13 +454,13 @@ app.post('/api/items', authenticateToken, async (req, res) => {
   const {
     text,
     tags,
-    embedding,
     location,
     foundAt,
     filename,
     description,
     description_score
   } = req.body;
+  const embedding = decodeEmbedding(req.body.embedding);
 
   if (!embedding || !Array.isArray(embedding)) {
     return res.status(400).json({ error: 'Missing or invalid embedding array' });
@@ -324,6 +497,12 @@ app.post('/api/items', authenticateToken, async (req, res) => {
     const rec = `R${req.user.organization_id}-${newId}`;
     await pool.query('UPDATE found_items SET record_number = $1 WHERE id = $2', [rec, newId]);
 
+    // Keep the ML service's in-memory similarity index current; the row is the source of truth,
+    // so a failed push only delays the item until the next backfill
+    axios.post(`${ML_SERVICE_URL}/index/items`, {
+      items: [{ id: String(newId), organization_id: req.user.organization_id, embedding }]
+    }, { timeout: 5000 }).catch(e => console.warn('[Vector Index Push Error]', e?.message || e));
+
     res.json({ status: 'ok', record_number: rec, id: newId });
   } catch (err) {
     console.error('[Insert Error]', err);
@@ -331,19 +510,130 @@ app.post('/api/items', authenticateToken, async (req, res) => {
   }
 });
 
+// 🔁 Internal endpoints for ml_service/backfill.py (re-embedding stored items).
+// Disabled unless ML_INTERNAL_TOKEN is set; callers send it as X-Internal-Token.
+function requireInternalToken(req, res, next) {
+  const expected = process.env.ML_INTERNAL_TOKEN;
+  if (!expected || req.get('X-Internal-Token') !== expected) {
+    return res.status(403).json({ error: 'Internal endpoint' });
+  }
+  next();
+}
+
+// Keyset-paginated items that have a stored photo, in id order
+app.get('/api/internal/items', requireInternalToken, async (req, res) => {
+  const afterId = parseInt(req.query.after_id, 10) || 0;
+  const limit = Math.min(Math.max(parseInt(req.query.limit, 10) || 100, 1), 1000);
+  const orgId = req.query.organization_id ? parseInt(req.query.organization_id, 10) : null;
+  try {
+    const result = await pool.query(
+      `SELECT id, filename, organization_id, ocr_text
+       FROM found_items
+       WHERE id > $1 AND filename IS NOT NULL AND ($3::int IS NULL OR organization_id = $3)
+       ORDER BY id
+       LIMIT $2`,
+      [afterId, limit, orgId]
+    );
+    res.json({ items: result.rows });
+  } catch (err) {
+    console.error('[Internal Items Error]', err);
+    res.status(500).json({ error: 'Failed to list items' });
+  }
+});
+
+// One UPDATE for a batch of regenerated fields; omitted (null) fields are left unchanged
+app.post('/api/internal/items/bulk-update', requireInternalToken, async (req, res) => {
+  const items = Array.isArray(req.body?.items) ? req.body.items : [];
+  if (items.length === 0) return res.json({ updated: 0 });
+  if (items.length > 1000) return res.status(400).json({ error: 'At most 1000 items per call' });
+  const rows = [];
+  for (const item of items) {
+    const embedding = decodeEmbedding(item.embedding);
+    if (embedding != null && !(Array.isArray(embedding) && embedding.length === 512)) {
+      return res.status(400).json({ error: `Item ${item.id}: embedding must be 512 dimensions` });
+    }
+    rows.push({
+      id: parseInt(item.id, 10),
+      embedding: embedding ? `[${embedding.join(',')}]` : null,
+      tags: Array.isArray(item.tags) ? item.tags : null,
+      description: item.description ?? null,
+      description_score: item.description_score ?? null,
+      ocr_text: item.ocr_text ?? null
+    });
+  }
+  try {
+    const result = await pool.query(
+      `UPDATE found_items fi SET
+         embedding = COALESCE(u.embedding::vector, fi.embedding),
+         tags = CASE WHEN u.tags IS NULL THEN fi.tags ELSE ARRAY(SELECT jsonb_array_elements_text(u.tags)) END,
+         description = COALESCE(u.description, fi.description),
+         description_score = COALESCE(u.description_score, fi.description_score),
+         ocr_text = COALESCE(u.ocr_text, fi.ocr_text)
+       FROM jsonb_to_recordset($1::jsonb)
+         AS u(id int, embedding text, tags jsonb, description text, description_score real, ocr_text text)
+       WHERE fi.id = u.id`,
+      [JSON.stringify(rows)]
+    );
+    res.json({ updated: result.rowCount });
+  } catch (err) {
+    console.error('[Internal Bulk Update Error]', err);
+    res.status(500).json({ error: 'Bulk update failed' });
+  }
+});
+
 const searchLimiter = rateLimit({ windowMs: 60 * 1000, max: 120 });
+
+// Nearest items by CLIP embedding (e.g. search-by-photo with the embedding returned by /api/ocr),
+// served from the ML service's in-memory index instead of a pgvector scan
+app.post('/api/similar', authenticateToken, searchLimiter, async (req, res) => {
+  const { keyword, k, excludeIds } = req.body;
+  const embedding = decodeEmbedding(req.body.embedding);
+  if (!(Array.isArray(embedding) && embedding.length === 512) && !(keyword && keyword.trim())) {
+    return res.status(400).json({ error: 'A 512-d embedding or a keyword is required' });
+  }
+  // The ML index searches one organization at a time; never fall through to a cross-organization search
+  if (req.user.organization_id == null) {
+    return res.status(403).json({ error: 'No organization assigned to this user' });
+  }
+  try {
+    const resp = await axios.post(`${ML_SERVICE_URL}/similar`, {
+      organization_id: req.user.organization_id,
+      embedding: Array.isArray(embedding) ? embedding : undefined,
+      text: Array.isArray(embedding) ? undefined : keyword,
+      k: Math.min(parseInt(k, 10) || 20, 100),
+      exclude_ids: (excludeIds || []).map(String)
+    }, { timeout: 10000 });
+    const hits = resp.data?.results || [];
+    if (hits.length === 0) return res.json({ results: [], search_ms: resp.data?.search_ms });
+
+    const rows = await pool.query(
+      'SELECT * FROM found_items WHERE id = ANY($1::int[]) AND organization_id = $2',
+      [hits.map(h => parseInt(h.id, 10)), req.user.organization_id]
+    );
+    const byId = new Map(rows.rows.map(r => [String(r.id), r]));
+    // Rows deleted since they were indexed are dropped here
+    const results = hits.filter(h => byId.has(h.id)).map(h => ({ ...byId.get(h.id), similarity: h.score }));
+    res.json({ results, search_ms: resp.data?.search_ms });
+  } catch (err) {
+    console.error('[Similar Search Error]', err?.message || err);
+    res.status(502).json({ error: 'Similarity search failed' });
+  }
+});
 app.post('/api/search', authenticateToken, searchLimiter, async (req, res) => {
   // semantic flag is no longer required; we always try both methods for better UX
   let { keyword, startDate, endDate, embedding } = req.body;
+  embedding = decodeEmbedding(embedding);
 
   try {
     // If no embedding provided and we have a keyword, try to get a CLIP text embedding
     let createdTextEmbedding = false;
     if (!embedding && keyword && keyword.trim().length > 0) {
       try {
-        const resp = await axios.post(`${ML_SERVICE_URL}/embed_text`, { text: keyword }, { timeout: 15000 });
-        if (Array.isArray(resp.data?.embedding) && resp.data.embedding.length === 512) {
-          embedding = resp.data.embedding;
+        // f32 is lossless and ~4x smaller than the JSON array
+        const resp = await axios.post(`${ML_SERVICE_URL}/embed_text`, { text: keyword, embedding_encoding: 'f32' }, { timeout: 15000 });
+        const textEmbedding = decodeEmbedding(resp.data?.embedding);
+        if (Array.isArray(textEmbedding) && textEmbedding.length === 512) {
+          embedding = textEmbedding;
           createdTextEmbedding = true;
         }
       } catch (e) {
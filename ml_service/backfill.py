@@ -0,0 +1,266 @@
+"""Regenerate stored item embeddings, tags and descriptions.
+
+After a change to the CLIP checkpoint, the tag vocabulary or the caption
+model, ``found_items.embedding``, ``tags`` and ``description`` are stale.
+This streams the stored photos through the same batched vision pipeline
+as ``/ocr`` and writes the results back in bulk:
+
+- items are read in id order, one page at a time, from the backend's
+  internal endpoints (``ML_INTERNAL_TOKEN``), so memory stays bounded by
+  ``--page-size``;
+- the photos of a page are analyzed concurrently, which lets the
+  micro-batchers form real batches. The stored OCR text is reused for tag
+  boosting; pass ``--ocr`` to re-run OCR and overwrite it. Re-run OCR is
+  limited to one job per OCR worker at a time, so page photos do not
+  expire in the pool's queue. An item whose OCR timed out, was rejected
+  or failed is recorded as failed and keeps its stored text;
+- each page is written with one bulk UPDATE and added to the similarity
+  index. The last written id is then checkpointed, so an interrupted run
+  resumes where it stopped;
+- the run throttles itself: it runs at low CPU priority with
+  ``--threads`` torch threads, keeps under ``--max-rate`` items/s, and
+  pauses while the live service reports more than ``--busy-threshold``
+  requests in flight (``mlsvc_server_requests_in_flight`` from
+  ``--live-url``/metrics, which covers every ``serve.py`` worker).
+
+The checkpoint records the model/vocabulary fingerprint. Resuming under a
+different one refuses to continue unless ``--restart`` is given.
+
+Usage (inside the ml_service container):
+    python backfill.py --checkpoint /root/.cache/backfill.json
+    python backfill.py --fields embedding --organization 3 --max-rate 2
+    python backfill.py --restart --dry-run --limit 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import requests
+
+FIELDS = ("embedding", "tags", "description")
+BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:3000")
+LIVE_URL = os.getenv("ML_LIVE_URL", "http://localhost:80")
+
+
+class Backend:
+    def __init__(self, url, token, uploads_dir=None, timeout=30.0):
+        self.url = url.rstrip("/")
+        self.uploads_dir = uploads_dir
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["X-Internal-Token"] = token or ""
+
+    def items(self, after_id, limit, organization=None):
+        params = {"after_id": after_id, "limit": limit}
+        if organization is not None:
+            params["organization_id"] = organization
+        r = self.session.get(f"{self.url}/api/internal/items", params=params, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()["items"]
+
+    def image(self, filename):
+        if self.uploads_dir:
+            with open(os.path.join(self.uploads_dir, os.path.basename(filename)), "rb") as f:
+                return f.read()
+        r = self.session.get(f"{self.url}/uploads/{filename}", timeout=self.timeout)
+        r.raise_for_status()
+        return r.content
+
+    def bulk_update(self, items):
+        r = self.session.post(f"{self.url}/api/internal/items/bulk-update", json={"items": items},
+                              timeout=self.timeout * 4)
+        r.raise_for_status()
+        return r.json()["updated"]
+
+
+def live_in_flight(live_url, timeout=2.0):
+    """Requests in flight on the live service (all workers), or None when it cannot be reached."""
+    try:
+        text = requests.get(f"{live_url.rstrip('/')}/metrics", timeout=timeout).text
+    except requests.RequestException:
+        return None
+    server, worker = None, 0.0
+    for line in text.splitlines():
+        if line.startswith("mlsvc_server_requests_in_flight "):
+            server = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("mlsvc_requests_in_flight{"):
+            worker += float(line.rsplit(" ", 1)[1])
+    # Services without the server-wide gauge only report the worker that answered
+    return server if server is not None else worker
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.state = {"last_id": 0, "processed": 0, "updated": 0, "failed": [], "fingerprint": None}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state.update(json.load(f))
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+
+def _ocr_degraded(ocr_info):
+    """The error when OCR did not run cleanly; such text must not overwrite the stored one."""
+    if ocr_info.get("timeout") or ocr_info.get("rejected") or ocr_info.get("error"):
+        return f"OCR degraded: {ocr_info.get('error') or 'timeout'}"
+    return None
+
+
+async def _analyze(service, backend, item, fields, ocr_slots, loop):
+    """``(update dict, None)`` or ``(None, error)`` for one stored item.
+    ``ocr_slots`` is a semaphore bounding concurrent OCR jobs, or None to reuse the stored text.
+    """
+    try:
+        contents = await loop.run_in_executor(None, backend.image, item["filename"])
+        ctx = await loop.run_in_executor(service._cpu_executor, service.decode_image, contents)
+        if ocr_slots is None:
+            text = item.get("ocr_text") or ""
+        else:
+            async with ocr_slots:
+                text, ocr_info = await service._ocr_stage(ctx)
+            degraded = _ocr_degraded(ocr_info)
+            if degraded:
+                return None, degraded
+        result = await service.analyze_image(ctx, ocr_text=text)
+    except Exception as e:
+        return None, str(e)
+    if not any(result["embedding"]):
+        return None, "vision pipeline fell back (zero embedding)"
+    update = {"id": item["id"]}
+    if "embedding" in fields:
+        update["embedding"] = result["embedding"]
+    if "tags" in fields:
+        update["tags"] = result["tags"]
+    if "description" in fields:
+        update["description"] = result["description"]
+        update["description_score"] = result["description_score"]
+    if ocr_slots is not None:
+        update["ocr_text"] = result["text"]
+    return update, None
+
+
+async def run(args):
+    import torch
+    torch.set_num_threads(args.threads)
+    try:
+        os.nice(args.nice)
+    except OSError:
+        pass
+    import main as service  # the same models, batchers and similarity index the service uses
+    service.models.load_all()
+    service.tag_vocabulary.labels()  # fetch now so the fingerprint below is the real one
+
+    fields = [f for f in args.fields.split(",") if f]
+    fingerprint = {
+        "clip": service.CLIP_MODEL_ID, "blip": service.BLIP_MODEL_ID, "caption_fast": service.CAPTION_FAST_MODEL,
+        "precision": service.INFERENCE_PRECISION, "vocabulary": service.tag_vocabulary.fingerprint,
+        "fields": fields, "organization": args.organization,
+    }
+    checkpoint = Checkpoint(None if args.dry_run else args.checkpoint)
+    if args.restart:
+        checkpoint.state.update(last_id=0, processed=0, updated=0, failed=[], fingerprint=None)
+    elif checkpoint.state["fingerprint"] not in (None, fingerprint):
+        print("[Backfill] checkpoint was written under a different model/vocabulary; use --restart")
+        return 2
+    checkpoint.state["fingerprint"] = fingerprint
+
+    ocr_slots = None
+    if args.ocr:
+        if service.ocr_pool is None:
+            print("[Backfill] --ocr needs an OCR engine (see OCR_ENGINES)")
+            return 2
+        ocr_slots = asyncio.Semaphore(service.ocr_pool.size)
+
+    backend = Backend(args.backend, args.token, args.uploads_dir)
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    done_this_run = 0
+    print(f"[Backfill] fields={fields} resuming after id {checkpoint.state['last_id']}")
+    while args.limit is None or done_this_run < args.limit:
+        in_flight = await loop.run_in_executor(None, live_in_flight, args.live_url) if args.busy_threshold >= 0 else None
+        if in_flight is not None and in_flight > args.busy_threshold:
+            await asyncio.sleep(args.busy_pause)
+            continue
+
+        page_size = args.page_size if args.limit is None else min(args.page_size, args.limit - done_this_run)
+        items = await loop.run_in_executor(
+            None, backend.items, checkpoint.state["last_id"], page_size, args.organization)
+        if not items:
+            break
+        page_started = time.perf_counter()
+        outcomes = await asyncio.gather(*[
+            _analyze(service, backend, item, fields, ocr_slots, loop) for item in items
+        ])
+        updates = [u for u, _ in outcomes if u is not None]
+        failed = [{"id": item["id"], "error": err} for item, (_, err) in zip(items, outcomes) if err]
+
+        if updates and not args.dry_run:
+            checkpoint.state["updated"] += await loop.run_in_executor(None, backend.bulk_update, updates)
+            if "embedding" in fields:
+                by_id = {item["id"]: item for item in items}
+                service.vector_index.add(
+                    (u["id"], by_id[u["id"]]["organization_id"], u["embedding"]) for u in updates
+                    if by_id[u["id"]]["organization_id"] is not None
+                )
+        checkpoint.state["last_id"] = items[-1]["id"]
+        checkpoint.state["processed"] += len(items)
+        checkpoint.state["failed"] = (checkpoint.state["failed"] + failed)[-1000:]
+        checkpoint.save()
+        done_this_run += len(items)
+
+        elapsed = time.perf_counter() - page_started
+        rate = done_this_run / (time.perf_counter() - started)
+        print(f"[Backfill] through id {items[-1]['id']}: {len(updates)} updated, {len(failed)} failed, "
+              f"{len(items) / elapsed:.1f} items/s (run avg {rate:.1f})")
+        if args.max_rate > 0:
+            # Sleep off whatever this page finished ahead of the rate cap
+            await asyncio.sleep(max(0.0, len(items) / args.max_rate - elapsed))
+
+    s = checkpoint.state
+    print(f"[Backfill] done: {s['processed']} processed, {s['updated']} updated, "
+          f"{len(s['failed'])} failed (see checkpoint) in {time.perf_counter() - started:.0f}s")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default=BACKEND_URL)
+    parser.add_argument("--token", default=os.getenv("ML_INTERNAL_TOKEN"), help="default: $ML_INTERNAL_TOKEN")
+    parser.add_argument("--uploads-dir", help="read photos from this directory instead of <backend>/uploads/")
+    parser.add_argument("--checkpoint", default=os.getenv("BACKFILL_CHECKPOINT", "/root/.cache/backfill.json"))
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first item")
+    parser.add_argument("--fields", default=",".join(FIELDS), help=f"comma-separated subset of {','.join(FIELDS)}")
+    parser.add_argument("--ocr", action="store_true", help="re-run OCR and overwrite ocr_text")
+    parser.add_argument("--organization", type=int, help="only this organization's items")
+    parser.add_argument("--page-size", type=int, default=32, help="items read, analyzed and written together")
+    parser.add_argument("--limit", type=int, help="stop after this many items")
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    parser.add_argument("--nice", type=int, default=10, help="CPU priority increment")
+    parser.add_argument("--max-rate", type=float, default=0.0, help="items per second cap (0 = none)")
+    parser.add_argument("--live-url", default=LIVE_URL, help="live ML service to yield to")
+    parser.add_argument("--busy-threshold", type=float, default=2,
+                        help="pause while the live service has more requests in flight (-1 = never pause)")
+    parser.add_argument("--busy-pause", type=float, default=5.0, help="seconds to wait when the live service is busy")
+    parser.add_argument("--dry-run", action="store_true", help="analyze but write nothing (no checkpoint either)")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.fields.split(",")) - set(FIELDS)
+    if unknown:
+        parser.error(f"unknown fields: {sorted(unknown)}")
+    if not args.token:
+        parser.error("an internal token is required (--token or ML_INTERNAL_TOKEN, matching the backend)")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
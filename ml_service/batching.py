@@ -0,0 +1,113 @@
+"""Dynamic micro-batching for model inference.
+
+Requests submit one preprocessed input and get a ``Future`` back. A worker
+thread collects pending inputs until ``max_batch_size`` is reached or the
+oldest one has waited ``max_wait_ms``, runs them through the model in one
+call and resolves each future with its own result. Futures cancelled while
+queued are dropped before the batch runs, so one abandoned request never
+affects the others in its batch.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    def __init__(self, name, run_batch, max_batch_size=8, max_wait_ms=10.0):
+        """``run_batch(items)`` must return one result per item, in order."""
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.batch_size_hist = {}   # batch size -> count
+        self.queue_depth_hist = {}  # queue depth seen at dispatch -> count
+        self.last_batch_ms = 0.0
+        self.avg_batch_ms = 0.0
+
+    def _ensure_started(self):
+        # Started lazily so the thread is created in the serving process
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=f"batcher-{self.name}", daemon=True)
+                self._thread.start()
+
+    def submit(self, item) -> Future:
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((item, fut))
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return fut
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = [(item, fut) for item, fut in self._collect() if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            depth = self._queue.qsize()
+            size = len(batch)
+            self.batch_size_hist[size] = self.batch_size_hist.get(size, 0) + 1
+            self.queue_depth_hist[depth] = self.queue_depth_hist.get(depth, 0) + 1
+            t0 = time.perf_counter()
+            try:
+                results = self.run_batch([item for item, _ in batch])
+                if len(results) != size:
+                    raise RuntimeError(f"{self.name}: expected {size} results, got {len(results)}")
+                for (_, fut), res in zip(batch, results):
+                    fut.set_result(res)
+            except Exception as e:
+                self.errors += 1
+                print(f"[Batcher {self.name} Error]", e)
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            self.batches += 1
+            self.items += size
+            self.last_batch_ms = elapsed_ms
+            self.avg_batch_ms = elapsed_ms if self.batches == 1 else 0.9 * self.avg_batch_ms + 0.1 * elapsed_ms
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "batch_size_hist": dict(sorted(self.batch_size_hist.items())),
+            "queue_depth_hist": dict(sorted(self.queue_depth_hist.items())),
+            "last_batch_ms": round(self.last_batch_ms, 1),
+            "avg_batch_ms": round(self.avg_batch_ms, 1),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
@@ -0,0 +1,171 @@
+"""Benchmark the downsampled text gate against the legacy full-resolution detector.
+
+Decodes every sample image the way the service does (``decode_upload``),
+then times ``text_gate.text_presence`` and the previous
+``detect_text_regions`` implementation on the same grayscale array. It
+reports both probabilities and whether they lead ``perform_intelligent_ocr``
+to the same decisions: skip OCR, Tesseract PSM, number of preprocessing
+variants, and low-confidence filtering. Agreement on a decision is vacuous
+when no image falls below its cut point (``THRESHOLDS``). Such cut points
+are listed under ``unexercised``.
+
+Usage (from ml_service/):
+    python bench_text_gate.py
+    python bench_text_gate.py --images ../sample_images --repeat 5 --out gate_report.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from decode import decode_upload
+from text_gate import get_adaptive_psm, text_presence
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except Exception as _heif_err:
+    print("[HEIC] pillow-heif not available:", _heif_err)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".heic")
+# Cut points perform_intelligent_ocr / get_adaptive_psm apply to the text probability
+THRESHOLDS = {
+    "psm_single_word": 0.1,   # PSM 8 below
+    "skip_ocr": 0.15,         # no OCR below
+    "quality_filter": 0.2,    # low-confidence text dropped below
+    "variants": 0.25,         # adaptive-threshold variant added above
+    "psm_block": 0.3,         # PSM 6 below; above, 11 or 6 from text_like_contours
+}
+
+
+def ocr_decisions(probability, characteristics):
+    """What perform_intelligent_ocr does with one gate result."""
+    return {
+        "skip_ocr": probability < THRESHOLDS["skip_ocr"],
+        "psm": get_adaptive_psm(probability, characteristics),
+        "variants": 3 if probability > THRESHOLDS["variants"] else 2,
+        "quality_filter": probability < THRESHOLDS["quality_filter"],
+    }
+
+
+def legacy_text_probability(gray):
+    """The full-resolution detector previously used by perform_intelligent_ocr (reference only).
+    Returns ``(probability, characteristics)`` with the keys ``get_adaptive_psm`` reads.
+    """
+    image_area = gray.shape[0] * gray.shape[1]
+    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    edge_density = np.sum(edges > 0) / image_area
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    text_like_contours = 0
+    line_like_contours = 0
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area < 20:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        aspect_ratio = w / h if h > 0 else 0
+        if 0.1 < aspect_ratio < 15 and area < image_area * 0.3:
+            text_like_contours += 1
+            if 2 < aspect_ratio < 12 and h > 5:
+                line_like_contours += 1
+    horizontal_lines = cv2.morphologyEx(edges, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (25, 1)))
+    vertical_lines = cv2.morphologyEx(edges, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, 25)))
+    h_line_density = np.sum(horizontal_lines > 0) / image_area
+    v_line_density = np.sum(vertical_lines > 0) / image_area
+    variance = cv2.Laplacian(gray, cv2.CV_64F).var()
+    probability = (
+        min(text_like_contours / 8.0, 1.0) * 0.3 +
+        min(line_like_contours / 5.0, 1.0) * 0.25 +
+        min(edge_density * 100, 1.0) * 0.2 +
+        min(variance / 1000.0, 1.0) * 0.15 +
+        min((h_line_density + v_line_density) * 200, 1.0) * 0.1
+    )
+    return probability, {"text_like_contours": text_like_contours}
+
+
+def _best_ms(fn, repeat):
+    best, value = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        value = fn()
+        ms = (time.perf_counter() - t0) * 1000.0
+        best = ms if best is None else min(best, ms)
+    return best, value
+
+
+def run(images_dir, repeat):
+    paths = [p for p in sorted(glob.glob(os.path.join(images_dir, "*"))) if p.lower().endswith(IMAGE_EXTENSIONS)]
+    if not paths:
+        raise SystemExit(f"no images found in {images_dir}")
+    rows = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                gray = decode_upload(f.read()).gray
+        except Exception as e:
+            print(f"[skip] {os.path.basename(path)}: {e}")
+            continue
+        legacy_ms, (legacy_p, legacy_chars) = _best_ms(lambda: legacy_text_probability(gray), repeat)
+        gate_ms, (gate_p, chars, regions) = _best_ms(lambda: text_presence(gray), repeat)
+        legacy_decisions, gate_decisions = ocr_decisions(legacy_p, legacy_chars), ocr_decisions(gate_p, chars)
+        agree = {name: legacy_decisions[name] == gate_decisions[name] for name in gate_decisions}
+        rows.append({
+            "image": os.path.basename(path),
+            "size": [gray.shape[1], gray.shape[0]],
+            "legacy_probability": round(float(legacy_p), 3),
+            "gate_probability": round(gate_p, 3),
+            "legacy_psm": legacy_decisions["psm"],
+            "gate_psm": gate_decisions["psm"],
+            "agree": agree,
+            "all_agree": all(agree.values()),
+            "legacy_ms": round(legacy_ms, 1),
+            "gate_ms": round(gate_ms, 1),
+            "gate_side": chars.get("gate_side"),
+            "regions": len(regions),
+        })
+        r = rows[-1]
+        print(f"{r['image']:<28} legacy={r['legacy_probability']:.3f} ({r['legacy_ms']:.1f} ms)  "
+              f"gate={r['gate_probability']:.3f} ({r['gate_ms']:.1f} ms @ {r['gate_side']}px)  "
+              f"regions={r['regions']} "
+              f"disagree={[n for n, ok in r['agree'].items() if not ok] or '-'}")
+
+    diffs = [abs(r["legacy_probability"] - r["gate_probability"]) for r in rows]
+    below = {name: sum(1 for r in rows if min(r["legacy_probability"], r["gate_probability"]) < cut)
+             for name, cut in THRESHOLDS.items()}
+    summary = {
+        "images": len(rows),
+        "agreement": {name: round(sum(r["agree"][name] for r in rows) / len(rows), 3) for name in rows[0]["agree"]},
+        "all_decisions_agreement": round(sum(r["all_agree"] for r in rows) / len(rows), 3),
+        "images_below": below,
+        "unexercised": [name for name, n in below.items() if n == 0],
+        "mean_abs_probability_diff": round(sum(diffs) / len(diffs), 3),
+        "legacy_ms_total": round(sum(r["legacy_ms"] for r in rows), 1),
+        "gate_ms_total": round(sum(r["gate_ms"] for r in rows), 1),
+    }
+    summary["speedup"] = round(summary["legacy_ms_total"] / max(summary["gate_ms_total"], 1e-6), 1)
+    return {"summary": summary, "images": rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=os.path.join(HERE, "..", "sample_images"))
+    parser.add_argument("--repeat", type=int, default=3, help="timing repetitions per image (best is kept)")
+    parser.add_argument("--out", help="write the full JSON report to this path")
+    args = parser.parse_args(argv)
+
+    report = run(args.images, max(1, args.repeat))
+    print(json.dumps(report["summary"], indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
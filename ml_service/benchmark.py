@@ -0,0 +1,331 @@
+"""Benchmark the /ocr pipeline stages over the sample image corpus.
+
+Runs each stage of the service pipeline on every image in ``sample_images/``
+plus ``ml_service/test.jpg``: decode (JPEG/PNG/WebP/HEIC), text gate,
+PaddleOCR, Tesseract fallback, BLIP caption, CLIP image embedding, label
+encoding and tag scoring. Reports per-stage p50/p95 latency, end-to-end
+throughput at several concurrency levels and peak RSS, as JSON that can be
+diffed across commits with ``--compare``.
+
+The throughput numbers are for this harness, not the service: N threads call
+the models directly, without the micro-batchers or the OCR worker pool, and
+the OCR stages are serialized behind one lock (one OCR stream, like the
+service's single Tesseract executor). PaddleOCR instances are not
+thread-safe. Use them to compare commits, not to size the service.
+
+``--stub`` swaps the models for deterministic NumPy stand-ins so the
+harness (and the non-model stages) runs without torch or model weights.
+OCR engines that are not installed are reported as skipped.
+
+Usage (from ml_service/):
+    python benchmark.py --stub --out bench_stub.json
+    python benchmark.py --precision int8 --concurrency 1,2,4 --out bench_int8.json
+    python benchmark.py --stub --compare bench_before.json
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from decode import decode_upload
+from model_registry import current_rss_mb
+from text_gate import text_presence
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".heic")
+LABELS = [
+    "wallet", "phone", "smartphone", "key", "keyring", "umbrella", "hat", "pen", "charger",
+    "credit card", "shoe", "glasses", "bag", "backpack", "passport", "boarding pass", "laptop",
+]
+
+
+class StubModels:
+    """Deterministic stand-ins with the shapes of the real models; no torch, no weights."""
+    name = "stub"
+    dim = 512
+
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        self._projection = rng.standard_normal((16 * 16 * 3, self.dim)).astype(np.float32)
+
+    def caption(self, image):
+        return "a photo of an item on a table"
+
+    def image_features(self, image):
+        small = np.asarray(image.resize((16, 16)), dtype=np.float32).reshape(-1) / 255.0
+        v = small @ self._projection
+        return v / (np.linalg.norm(v) + 1e-9)
+
+    def encode_labels(self, labels):
+        rows = []
+        for label in labels:
+            seed = int.from_bytes(hashlib.sha1(label.encode("utf-8")).digest()[:4], "little")
+            v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            rows.append(v / np.linalg.norm(v))
+        return np.stack(rows)
+
+
+class RealModels:
+    """BLIP + CLIP loaded the way the service loads them (precision applied)."""
+    def __init__(self, precision="fp32", device="cpu"):
+        import torch
+        from quality_check import load_models
+        from label_embeddings import LabelEmbeddingStore
+        self.torch = torch
+        self.device = device
+        self.name = f"real@{precision}"
+        bundle = load_models(precision, device)
+        self.clip_model, self.clip_processor = bundle["clip"]
+        self.blip_model, self.blip_processor = bundle["blip"]
+        self._store_factory = lambda: LabelEmbeddingStore(f"bench@{precision}")
+
+    def caption(self, image):
+        with self.torch.no_grad():
+            inputs = self.blip_processor(images=image, return_tensors="pt").to(self.device)
+            out = self.blip_model.generate(**inputs, max_new_tokens=30)
+        return self.blip_processor.tokenizer.decode(out[0], skip_special_tokens=True).strip()
+
+    def image_features(self, image):
+        with self.torch.no_grad():
+            inputs = self.clip_processor(images=image, return_tensors="pt").to(self.device)
+            feats = self.clip_model.get_image_features(**inputs)
+            feats = feats / feats.norm(dim=-1, keepdim=True)
+        return feats.squeeze(0).float().cpu().numpy()
+
+    def encode_labels(self, labels):
+        # A fresh store each time so this measures encoding, not the cache
+        store = self._store_factory()
+        return store.get(labels, self.clip_model, self.clip_processor.tokenizer, self.device).float().cpu().numpy()
+
+
+def _ocr_stages():
+    """Name -> callable(ctx) for the OCR engines that are installed here.
+    All of them share one lock: the engine instances are not thread-safe.
+    """
+    stages = {}
+    ocr_lock = threading.Lock()
+
+    def serialized(fn):
+        def run(ctx):
+            with ocr_lock:
+                return fn(ctx)
+        return run
+
+    from ocr_engines import get_engine, ENGINES
+    if ENGINES["paddleocr"].available():
+        paddle = get_engine("paddleocr")
+        stages["paddleocr"] = serialized(lambda ctx: paddle.recognize(ctx.rgb).filtered(paddle.min_confidence, 3).text)
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        from tesseract_engine import TesseractEngine
+        engine = TesseractEngine()
+        stages["tesseract_fallback"] = serialized(lambda ctx: engine.run(ctx.gray, 6)[0][0])
+    except Exception as e:
+        print("[Benchmark] Tesseract unavailable:", str(e).splitlines()[0])
+    return stages
+
+
+def _softmax_top(features, label_matrix):
+    logits = label_matrix @ features
+    probs = np.exp(logits - logits.max())
+    probs /= probs.sum()
+    top = int(np.argmax(probs))
+    return top, float(probs[top])
+
+
+def run_image(contents, models, label_matrix, ocr_stages, timings=None):
+    """The service pipeline for one upload, stage by stage; records ms per stage into ``timings``."""
+    def timed(name, fn, *args):
+        t0 = time.perf_counter()
+        value = fn(*args)
+        if timings is not None:
+            timings.setdefault(name, []).append((time.perf_counter() - t0) * 1000.0)
+        return value
+
+    ctx = timed("decode", decode_upload, contents)
+    probability, _, _ = timed("text_gate", text_presence, ctx.gray)
+    text = ""
+    if "paddleocr" in ocr_stages:
+        text = timed("paddleocr", ocr_stages["paddleocr"], ctx)
+    # Same rule as the service: fall back only when Paddle found nothing and the gate sees text
+    if not text and "tesseract_fallback" in ocr_stages and probability >= 0.15:
+        text = timed("tesseract_fallback", ocr_stages["tesseract_fallback"], ctx)
+    caption = timed("blip_caption", models.caption, ctx.vision_image)
+    features = timed("clip_image", models.image_features, ctx.vision_image)
+    top, score = timed("tag_scoring", _softmax_top, features, label_matrix)
+    return {"caption": caption, "tag": LABELS[top], "score": score, "text": text}
+
+
+def _summary(values):
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "n": int(arr.size),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "mean_ms": round(float(arr.mean()), 2),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def collect_images(images_dir):
+    paths = [p for p in sorted(glob.glob(os.path.join(images_dir, "*")))
+             if p.lower().endswith(IMAGE_EXTENSIONS)]
+    extra = os.path.join(HERE, "test.jpg")
+    if os.path.exists(extra):
+        paths.append(extra)
+    return paths
+
+
+def benchmark(images_dir, stub=False, precision="fp32", repeat=3, concurrency=(1, 2, 4)):
+    paths = collect_images(images_dir)
+    if not paths:
+        raise SystemExit(f"no images found in {images_dir}")
+    uploads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            uploads.append((os.path.basename(path), f.read()))
+
+    rss_start = current_rss_mb()
+    t0 = time.perf_counter()
+    models = StubModels() if stub else RealModels(precision)
+    load_s = time.perf_counter() - t0
+    ocr_stages = _ocr_stages()
+
+    timings = {}
+    label_matrix = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        label_matrix = models.encode_labels(LABELS)
+        timings.setdefault("label_encoding", []).append((time.perf_counter() - t0) * 1000.0)
+
+    # Warm-up pass (lazy engine loads, allocator growth) is not measured
+    skipped = []
+    for name, contents in uploads:
+        try:
+            run_image(contents, models, label_matrix, ocr_stages)
+        except Exception as e:
+            print(f"[skip] {name}: {e}")
+            skipped.append(name)
+    uploads = [u for u in uploads if u[0] not in skipped]
+
+    for _ in range(max(1, repeat)):
+        for _, contents in uploads:
+            run_image(contents, models, label_matrix, ocr_stages, timings)
+
+    throughput = []
+    for workers in concurrency:
+        latencies = []
+
+        def _one(contents):
+            t = time.perf_counter()
+            run_image(contents, models, label_matrix, ocr_stages)
+            latencies.append((time.perf_counter() - t) * 1000.0)
+
+        jobs = [c for _, c in uploads] * max(1, repeat)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_one, jobs))
+        elapsed = time.perf_counter() - t0
+        throughput.append({
+            "concurrency": workers,
+            "images": len(jobs),
+            "seconds": round(elapsed, 3),
+            "images_per_sec": round(len(jobs) / elapsed, 2),
+            "latency": _summary(latencies),
+        })
+        print(f"concurrency={workers}: {throughput[-1]['images_per_sec']} img/s, "
+              f"p50={throughput[-1]['latency']['p50_ms']} ms p95={throughput[-1]['latency']['p95_ms']} ms")
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "mode": models.name,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "images": len(uploads),
+            "skipped": skipped,
+            "repeat": repeat,
+            "ocr_stages": list(ocr_stages),
+            "model_load_seconds": round(load_s, 2),
+            "throughput_mode": "direct model calls from N threads, OCR serialized (no batchers, no OCR pool)",
+        },
+        "stages": {name: _summary(values) for name, values in timings.items()},
+        "throughput": throughput,
+        "memory": {
+            "rss_start_mb": round(rss_start, 1),
+            "rss_end_mb": round(current_rss_mb(), 1),
+            # ru_maxrss is in KB on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        },
+    }
+
+
+def compare(report, baseline):
+    """Print p50/p95 changes per stage and throughput against an earlier report."""
+    print(f"vs {baseline['meta'].get('commit')} ({baseline['meta'].get('mode')}):")
+    for name, cur in report["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old:
+            print(f"  {name:<20} new")
+            continue
+        d50 = (cur["p50_ms"] - old["p50_ms"]) / max(old["p50_ms"], 1e-6) * 100.0
+        d95 = (cur["p95_ms"] - old["p95_ms"]) / max(old["p95_ms"], 1e-6) * 100.0
+        print(f"  {name:<20} p50 {old['p50_ms']:>9.2f} -> {cur['p50_ms']:>9.2f} ms ({d50:+.1f}%)  "
+              f"p95 {old['p95_ms']:>9.2f} -> {cur['p95_ms']:>9.2f} ms ({d95:+.1f}%)")
+    old_tp = {t["concurrency"]: t for t in baseline.get("throughput", [])}
+    for t in report["throughput"]:
+        old = old_tp.get(t["concurrency"])
+        if old:
+            print(f"  concurrency {t['concurrency']:<8} {old['images_per_sec']:>9.2f} -> {t['images_per_sec']:>9.2f} img/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=os.path.join(HERE, "..", "sample_images"))
+    parser.add_argument("--stub", action="store_true", help="use NumPy stand-ins instead of BLIP/CLIP")
+    parser.add_argument("--precision", default="fp32", choices=["fp32", "int8"])
+    parser.add_argument("--repeat", type=int, default=3, help="measured passes over the corpus")
+    parser.add_argument("--concurrency", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--out", help="write the JSON report to this path")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except Exception as e:
+        print("[HEIC] pillow-heif not available:", e)
+
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    report = benchmark(args.images, stub=args.stub, precision=args.precision, repeat=args.repeat, concurrency=levels)
+    print(json.dumps({"stages": report["stages"], "memory": report["memory"]}, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
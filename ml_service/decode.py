@@ -0,0 +1,81 @@
+"""Resolution-aware decode stage for uploads.
+
+Phone photos arrive at 12 MP or more, but the vision models only need a few
+hundred pixels and OCR works well at ~2K. This stage:
+
+- decodes JPEGs in draft mode (DCT scaling by 1/2, 1/4 or 1/8) when the
+  photo is larger than the OCR bound, so the full-size bitmap is never built;
+- uses an embedded HEIC thumbnail for the vision models when one is large
+  enough (iPhone thumbnails are usually too small, then the primary image is
+  decoded once);
+- bounds the OCR image to ``OCR_MAX_SIDE`` pixels on its longest side;
+
+and reports what it did, with timings, in ``ImageContext.decode_info``.
+"""
+import io
+import math
+import os
+import time
+
+from PIL import Image
+
+from image_context import ImageContext, VISION_MIN_SIDE
+
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2048"))
+
+
+def _heif_vision_thumbnail(img, min_side):
+    """Largest embedded HEIC thumbnail whose shortest side is >= ``min_side``, else None."""
+    boxes = img.info.get("thumbnails") or []
+    if not boxes or max(boxes) < min_side:
+        return None
+    try:
+        import pillow_heif
+        heif = pillow_heif.open_heif(img.fp, convert_hdr_to_8bit=True)
+        primary = heif[heif.primary_index] if hasattr(heif, "primary_index") else heif[0]
+        best = max(range(len(boxes)), key=lambda i: boxes[i])
+        thumb = primary.get_thumbnail(best).to_pillow()
+        if min(thumb.size) >= min_side:
+            return thumb.convert("RGB")
+    except Exception as e:
+        print("[Decode] HEIC thumbnail unavailable:", e)
+    return None
+
+
+def decode_upload(contents: bytes, ocr_max_side: int = OCR_MAX_SIDE, vision_min_side: int = VISION_MIN_SIDE) -> ImageContext:
+    t0 = time.perf_counter()
+    img = Image.open(io.BytesIO(contents))
+    fmt = img.format
+    original_size = img.size
+    info = {"format": fmt, "original_size": list(original_size), "bytes": len(contents)}
+
+    vision_source = None
+    w, h = original_size
+    ratio = ocr_max_side / float(max(w, h))
+    if fmt == "JPEG" and ratio < 1.0:
+        # DCT-domain downscale: picks the largest 1/2^n reduction that stays >= the requested size
+        img.draft("RGB", (math.ceil(w * ratio), math.ceil(h * ratio)))
+        info["draft_scale"] = round(original_size[0] / float(img.size[0]), 2)
+    elif fmt in ("HEIF", "HEIC"):
+        vision_source = _heif_vision_thumbnail(img, vision_min_side)
+        info["heic_thumbnail"] = list(vision_source.size) if vision_source is not None else None
+
+    img.load()
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    t_decoded = time.perf_counter()
+
+    if max(img.size) > ocr_max_side:
+        # reducing_gap lets Pillow use fast integer reduction before the final resample
+        img.thumbnail((ocr_max_side, ocr_max_side), Image.BICUBIC, reducing_gap=2.0)
+
+    ctx = ImageContext(img, vision_source=vision_source)
+    t_done = time.perf_counter()
+    info.update({
+        "decoded_size": list(img.size),
+        "decode_ms": round((t_decoded - t0) * 1000.0, 1),
+        "resize_ms": round((t_done - t_decoded) * 1000.0, 1),
+        "total_ms": round((t_done - t0) * 1000.0, 1),
+    })
+    ctx.decode_info = info
+    return ctx
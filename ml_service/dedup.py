@@ -0,0 +1,163 @@
+"""Near-duplicate detection for intake photos.
+
+Each decoded upload gets a 256-bit difference hash (dHash) computed from the
+small vision image, which is robust to re-encoding, resizing and mild
+exposure changes. A bounded in-memory index of recent uploads (hash,
+aspect ratio, CLIP embedding, result) is searched with vectorized Hamming
+distance and cosine similarity:
+
+- hash distance <= ``short_circuit_distance`` (and same aspect ratio): the
+  stored result is reused and inference is skipped. Only entries analyzed
+  under the same ``variant`` (caption tier and tag vocabulary, the parts of
+  the result cache key that change at runtime) qualify;
+- hash distance <= ``hint_distance`` or embedding cosine >= ``embedding_threshold``:
+  the fresh result carries a "possible duplicate of" hint.
+
+Both searches only see entries added for the same ``organization_id``, the
+same scoping ``/similar`` applies, so one organization's uploads never
+answer or hint for another's. Uploads without an organization only match
+each other.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+HASH_SIZE = 16  # 16x16 = 256-bit hash
+
+
+def dhash(image, hash_size=HASH_SIZE) -> np.ndarray:
+    """Packed difference hash (``hash_size**2 / 8`` bytes) of a PIL image or grayscale array."""
+    gray = image if isinstance(image, np.ndarray) else np.asarray(image.convert("L"))
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    diff = small[:, 1:] > small[:, :-1]
+    return np.packbits(diff.reshape(-1))
+
+
+class DuplicateIndex:
+    def __init__(self, capacity=2000, short_circuit_distance=8, hint_distance=26,
+                 embedding_threshold=0.97, aspect_tolerance=0.03):
+        self.capacity = max(1, int(capacity))
+        self.short_circuit_distance = int(short_circuit_distance)
+        self.hint_distance = int(hint_distance)
+        self.embedding_threshold = float(embedding_threshold)
+        self.aspect_tolerance = float(aspect_tolerance)
+        self._entries = OrderedDict()  # (organization_id, image_id) -> entry dict
+        self._lock = threading.Lock()
+        # Dense copies for vectorized search, rebuilt lazily after changes
+        self._ids = []
+        self._hashes = None
+        self._aspects = None
+        self._variants = []
+        self._organizations = []
+        self._embeddings = None
+        self._dirty = True
+        self.short_circuits = 0
+        self.hints = 0
+
+    def _rebuild(self):
+        entries = list(self._entries.values())
+        self._ids = list(self._entries)
+        self._variants = [e["variant"] for e in entries]
+        self._organizations = [e["organization_id"] for e in entries]
+        if entries:
+            self._hashes = np.stack([e["hash"] for e in entries])
+            self._aspects = np.array([e["aspect"] for e in entries], dtype=np.float32)
+            self._embeddings = np.stack([e["embedding"] for e in entries])
+        else:
+            self._hashes = self._aspects = self._embeddings = None
+        self._dirty = False
+
+    def _distances(self, h):
+        if self._dirty:
+            self._rebuild()
+        if self._hashes is None:
+            return None
+        return np.unpackbits(np.bitwise_xor(self._hashes, h[None, :]), axis=1).sum(axis=1)
+
+    def _same_organization(self, organization_id):
+        return np.array([o == organization_id for o in self._organizations], dtype=bool)
+
+    def _hint(self, idx, distance=None, similarity=None):
+        entry = self._entries[self._ids[idx]]
+        return {
+            "image_id": entry["image_id"],
+            "hash_distance": int(distance) if distance is not None else None,
+            "embedding_similarity": round(float(similarity), 4) if similarity is not None else None,
+            "seen_seconds_ago": round(time.time() - entry["ts"], 1),
+        }
+
+    def find_exact_reuse(self, h, aspect, variant=None, organization_id=None):
+        """Stored ``(result, hint)`` for a near-identical image of ``organization_id`` analyzed under
+        ``variant``, or ``(None, None)``.
+        """
+        with self._lock:
+            dist = self._distances(h)
+            if dist is None:
+                return None, None
+            same_shape = np.abs(self._aspects - aspect) <= self.aspect_tolerance * aspect
+            same_shape &= np.array([v == variant for v in self._variants], dtype=bool)
+            same_shape &= self._same_organization(organization_id)
+            dist = np.where(same_shape, dist, np.iinfo(dist.dtype).max)
+            idx = int(np.argmin(dist))
+            if dist[idx] > self.short_circuit_distance:
+                return None, None
+            self.short_circuits += 1
+            entry = self._entries[self._ids[idx]]
+            return entry["result"], self._hint(idx, distance=dist[idx])
+
+    def find_similar(self, h, embedding, organization_id=None):
+        """Hint dict for the closest recent upload of ``organization_id`` by hash or embedding, or None."""
+        with self._lock:
+            dist = self._distances(h)
+            if dist is None:
+                return None
+            sims = self._embeddings @ embedding
+            same_org = self._same_organization(organization_id)
+            if not same_org.any():
+                return None
+            dist = np.where(same_org, dist, np.iinfo(dist.dtype).max)
+            sims = np.where(same_org, sims, -np.inf)
+            best_hash = int(np.argmin(dist))
+            best_emb = int(np.argmax(sims))
+            if dist[best_hash] <= self.hint_distance:
+                idx = best_hash
+            elif sims[best_emb] >= self.embedding_threshold:
+                idx = best_emb
+            else:
+                return None
+            self.hints += 1
+            return self._hint(idx, distance=dist[idx], similarity=sims[idx])
+
+    def add(self, image_id, h, aspect, embedding, result, variant=None, organization_id=None):
+        emb = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(emb))
+        if norm == 0.0:
+            return
+        # Keyed per organization so the same photo uploaded by two organizations keeps both entries
+        key = (organization_id, image_id)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = {
+                "image_id": image_id,
+                "hash": h,
+                "aspect": float(aspect),
+                "embedding": emb / norm,
+                "result": result,
+                "variant": variant,
+                "organization_id": organization_id,
+                "ts": time.time(),
+            }
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "short_circuits": self.short_circuits,
+            "hints": self.hints,
+        }
@@ -0,0 +1,145 @@
+"""Compact wire encodings for embedding vectors.
+
+By default embeddings go out as JSON lists of floats (~11 KB for 512-d).
+Clients can opt into a base64 payload instead, per request with an
+``embedding_encoding`` parameter or with ``Accept: application/json;
+embedding=f16``:
+
+    {"encoding": "f16", "dim": 512, "data": "<base64>"}            # ~1.4 KB
+    {"encoding": "i8", "dim": 512, "data": "<base64>", "scale": s} # ~0.8 KB, value = int8 * scale
+
+``f32`` is lossless. ``f16`` and ``i8`` are lossy, and
+``python embedding_codec.py`` reports how much on random unit vectors
+(or ``--embeddings file.json``) along with payload sizes and encode/parse
+times. It exits 1 when a format's cosine to the original drops below
+``--min-cosine``. All encodings are little-endian. The backend's
+``decodeEmbedding`` mirrors ``decode``.
+"""
+import argparse
+import base64
+import json
+import sys
+import time
+
+import numpy as np
+
+ENCODINGS = ("json", "f32", "f16", "i8")
+_DTYPES = {"f32": "<f4", "f16": "<f2"}
+
+
+def negotiate(requested=None, accept=None):
+    """Encoding from an explicit parameter, else an ``embedding=`` Accept parameter, else ``json``."""
+    if requested:
+        requested = requested.strip().lower()
+        if requested not in ENCODINGS:
+            raise ValueError(f"embedding_encoding must be one of {list(ENCODINGS)}")
+        return requested
+    for media_range in (accept or "").split(","):
+        for param in media_range.split(";")[1:]:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "embedding" and value.strip().lower() in ENCODINGS:
+                return value.strip().lower()
+    return "json"
+
+
+def encode(vector, encoding="json"):
+    """Wire form of one vector: a float list for ``json``, otherwise a base64 payload dict."""
+    if encoding == "json":
+        return vector.tolist() if isinstance(vector, np.ndarray) else list(vector)
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    out = {"encoding": encoding, "dim": int(v.size)}
+    if encoding == "i8":
+        scale = float(np.abs(v).max()) / 127.0 or 1.0
+        raw = np.clip(np.rint(v / scale), -127, 127).astype(np.int8).tobytes()
+        out["scale"] = scale
+    elif encoding in _DTYPES:
+        raw = v.astype(_DTYPES[encoding]).tobytes()
+    else:
+        raise ValueError(f"unknown embedding encoding {encoding!r}")
+    out["data"] = base64.b64encode(raw).decode("ascii")
+    return out
+
+
+def decode(payload) -> np.ndarray:
+    """float32 vector from either wire form."""
+    if not isinstance(payload, dict):
+        return np.asarray(payload, dtype=np.float32)
+    raw = base64.b64decode(payload["data"])
+    encoding = payload["encoding"]
+    if encoding == "i8":
+        v = np.frombuffer(raw, dtype=np.int8).astype(np.float32) * np.float32(payload["scale"])
+    elif encoding in _DTYPES:
+        v = np.frombuffer(raw, dtype=_DTYPES[encoding]).astype(np.float32)
+    else:
+        raise ValueError(f"unknown embedding encoding {encoding!r}")
+    if "dim" in payload and v.size != int(payload["dim"]):
+        raise ValueError(f"embedding payload has {v.size} values, expected {payload['dim']}")
+    return v
+
+
+def encode_fields(result: dict, encoding: str, keys=("embedding",)) -> dict:
+    """Copy of a response dict with its embedding field(s) encoded; ``json`` returns it unchanged."""
+    if encoding == "json":
+        return result
+    out = dict(result)
+    for key in keys:
+        value = out.get(key)
+        if value is not None and len(value):
+            out[key] = encode(value, encoding)
+    return out
+
+
+def roundtrip_report(vectors):
+    """Per-encoding payload size, worst cosine / max abs error vs the original, and encode+parse time."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    report = {}
+    for encoding in ENCODINGS:
+        t0 = time.perf_counter()
+        bodies = [json.dumps({"embedding": encode(v, encoding)}) for v in vectors]
+        encode_ms = (time.perf_counter() - t0) * 1000.0
+        t0 = time.perf_counter()
+        decoded = np.stack([decode(json.loads(b)["embedding"]) for b in bodies])
+        parse_ms = (time.perf_counter() - t0) * 1000.0
+        cos = np.sum(decoded * vectors, axis=1) / (
+            np.linalg.norm(decoded, axis=1) * np.linalg.norm(vectors, axis=1) + 1e-12)
+        report[encoding] = {
+            "bytes_per_vector": round(sum(len(b) for b in bodies) / len(bodies)),
+            "min_cosine": round(float(cos.min()), 7),
+            "max_abs_error": float(np.abs(decoded - vectors).max()),
+            "encode_us_per_vector": round(encode_ms * 1000.0 / len(vectors), 1),
+            "parse_us_per_vector": round(parse_ms * 1000.0 / len(vectors), 1),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", help="JSON file with a list of embeddings (default: random unit vectors)")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--min-cosine", type=float, default=0.999)
+    parser.add_argument("--out", help="write the JSON report to this path")
+    args = parser.parse_args(argv)
+
+    if args.embeddings:
+        with open(args.embeddings) as f:
+            vectors = np.asarray(json.load(f), dtype=np.float32)
+    else:
+        vectors = np.random.default_rng(0).standard_normal((args.count, args.dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    report = roundtrip_report(vectors)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failing = [e for e, r in report.items() if r["min_cosine"] < args.min_cosine]
+    if failing:
+        print("❌ round-trip cosine below threshold for:", ", ".join(failing))
+        return 1
+    print("✅ all encodings within threshold")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Per-request image context.
+
+One upload is decoded once and wrapped in an ``ImageContext``. Derived
+forms (RGB array, grayscale, the reduced vision image, model pixel tensors) are
+computed lazily on first access and memoized, so OCR, text detection and
+the vision models share them instead of each converting the full-size
+photo again.
+"""
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Shortest side kept for the vision models (BLIP resizes to 384, CLIP to 224)
+VISION_MIN_SIDE = 448
+
+
+class ImageContext:
+    def __init__(self, image: Image.Image, vision_source: Image.Image = None):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        self.image = image
+        # Optional smaller decode (e.g. an embedded HEIC thumbnail) to feed the vision models
+        self.vision_source = vision_source
+        self.decode_info = {}
+        self._memo = {}
+        self._lock = threading.RLock()
+
+    @property
+    def size(self):
+        return self.image.size
+
+    def _get(self, key, compute):
+        value = self._memo.get(key)
+        if value is None:
+            with self._lock:
+                value = self._memo.get(key)
+                if value is None:
+                    value = compute()
+                    self._memo[key] = value
+        return value
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """HxWx3 uint8 RGB array shared by all stages; treat it as read-only."""
+        return self._get("rgb", lambda: np.asarray(self.image))
+
+    @property
+    def gray(self) -> np.ndarray:
+        """HxW uint8 grayscale, converted straight from RGB."""
+        return self._get("gray", lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY))
+
+    @property
+    def vision_image(self) -> Image.Image:
+        """Shared input for the model processors: shortest side reduced to VISION_MIN_SIDE."""
+        def _compute():
+            source = self.vision_source or self.image
+            w, h = source.size
+            scale = VISION_MIN_SIDE / float(min(w, h))
+            if scale >= 1.0:
+                return source
+            return source.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BICUBIC)
+        return self._get("vision_image", _compute)
+
+    def pixels(self, key, compute):
+        """Memoized model input, e.g. ``ctx.pixels("clip", lambda img: processor(images=img, ...))``.
+        ``compute`` receives ``vision_image``.
+        """
+        return self._get(("pixels", key), lambda: compute(self.vision_image))
+
+
+def as_context(image) -> ImageContext:
+    return image if isinstance(image, ImageContext) else ImageContext(image)
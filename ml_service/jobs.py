@@ -0,0 +1,262 @@
+"""Asynchronous analysis jobs with progressive results.
+
+``JobStore.submit(coro_fn)`` starts the analysis as an event-loop task and
+returns a ``Job`` at once. While it runs, pipeline code calls
+``publish(stage, **fields)``; the call is a no-op outside a job. Like
+``metrics.stage``, it finds the job through a context variable, so nothing
+is threaded through the pipeline, and tasks created with
+``asyncio.ensure_future`` inherit the binding.
+
+Clients either poll ``Job.snapshot()`` (the fields published so far are
+merged into ``partial``) or follow ``Job.events()`` as server-sent events.
+``Last-Event-ID`` resumes after a reconnect. Finished jobs are kept for
+``ttl`` seconds. ``JobStore`` is not thread-safe: call it only from the
+event loop (``async def`` routes). The exceptions are ``active()`` and
+``stats()``, which read plain counters so that sync routes (``/health``)
+and metrics gauges can call them from other threads.
+
+With ``spool_dir`` set (multi-process serving), every event is also
+appended to ``<spool_dir>/<job_id>.jsonl``. A worker asked about a job it
+is not running then serves it from that file, tailing it for new events.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+SPOOL_POLL_SECONDS = 0.25
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+_current = contextvars.ContextVar("analysis_job", default=None)
+
+
+class JobLimitReached(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, kind, transform=None, spool_path=None, created=None):
+        self.id = job_id
+        self.kind = kind
+        self.transform = transform  # applied to published fields and the result (e.g. embedding encoding)
+        self.spool_path = spool_path
+        self.status = QUEUED
+        self.created = created or time.time()
+        self.finished = None
+        self.partial = {}
+        self.result = None
+        self.error = None
+        self._events = []  # (stage, fields), in publish order
+        self._changed = asyncio.Event()
+        if spool_path is not None and not os.path.exists(spool_path):
+            self._spool({"job_id": job_id, "kind": kind, "created": self.created})
+
+    def _spool(self, record):
+        if self.spool_path is not None:
+            with open(self.spool_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def _record(self, stage, fields):
+        if stage == "done":
+            self.status, self.result = DONE, fields["result"]
+        elif stage == "error":
+            self.status, self.error = FAILED, fields["error"]
+        else:
+            self.status = RUNNING
+            self.partial.update(fields)
+        if stage in ("done", "error"):
+            self.finished = self.finished or time.time()
+        self._events.append((stage, fields))
+
+    def _emit(self, stage, fields):
+        self._spool({"stage": stage, "fields": fields})
+        self._record(stage, fields)
+        # Wake current waiters, then re-arm for the next event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, stage, fields):
+        if self.transform is not None:
+            fields = self.transform(fields)
+        self._emit(stage, fields)
+
+    def finish(self, result=None, error=None):
+        if error is not None:
+            self._emit("error", {"error": error})
+        else:
+            self._emit("done", {"result": self.transform(result) if self.transform else result})
+
+    @property
+    def terminal(self):
+        return self.status in (DONE, FAILED)
+
+    def snapshot(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stages": [stage for stage, _ in self._events if stage not in ("done", "error")],
+            "partial": dict(self.partial),
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+    async def _wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def events(self, after=-1, heartbeat=15.0):
+        """Server-sent event frames from event index ``after + 1``, ending after done/error."""
+        index = after + 1
+        last_sent = time.monotonic()
+        while True:
+            while index < len(self._events):
+                stage, fields = self._events[index]
+                yield f"id: {index}\nevent: {stage}\ndata: {json.dumps(fields)}\n\n"
+                index += 1
+                last_sent = time.monotonic()
+            if self.terminal:
+                return
+            await self._wait(heartbeat)
+            if time.monotonic() - last_sent >= heartbeat:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+
+
+class SpooledJob(Job):
+    """Read-only view of a job running in another process, rebuilt from its spool file."""
+
+    def __init__(self, path):
+        with open(path) as f:
+            header = json.loads(f.readline())
+            self._pos = f.tell()
+        super().__init__(header["job_id"], header["kind"], created=header["created"])
+        self.spool_path = path
+        self.refresh()
+
+    def refresh(self):
+        try:
+            with open(self.spool_path, "rb") as f:
+                f.seek(self._pos)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        end = chunk.rfind(b"\n") + 1  # a line still being written is picked up next time
+        for line in chunk[:end].splitlines():
+            entry = json.loads(line)
+            self._record(entry["stage"], entry["fields"])
+        self._pos += end
+
+    async def _wait(self, timeout):
+        await asyncio.sleep(min(timeout, SPOOL_POLL_SECONDS))
+        self.refresh()
+
+
+class JobStore:
+    def __init__(self, max_active=32, max_jobs=1000, ttl=600.0, spool_dir=None):
+        self.max_active = max_active
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.spool_dir = spool_dir
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        self._jobs = OrderedDict()  # id -> Job, oldest first
+        self._tasks = {}
+        self._swept = 0.0
+        self._active = 0  # updated on the loop only
+        self.submitted = 0
+        self.rejected = 0
+
+    def active(self):
+        return self._active
+
+    def _spool_path(self, job_id):
+        return os.path.join(self.spool_dir, f"{job_id}.jsonl") if self.spool_dir else None
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            too_many = len(self._jobs) > self.max_jobs
+            if job.terminal and (too_many or now - job.finished > self.ttl):
+                del self._jobs[job_id]
+                if job.spool_path:
+                    try:
+                        os.remove(job.spool_path)
+                    except FileNotFoundError:
+                        pass  # swept by another worker
+        # Spool files orphaned by a worker that died mid-job
+        if self.spool_dir and now - self._swept > 60.0:
+            self._swept = now
+            for name in os.listdir(self.spool_dir):
+                path = os.path.join(self.spool_dir, name)
+                try:
+                    if now - os.path.getmtime(path) > 2 * self.ttl:
+                        os.remove(path)
+                except FileNotFoundError:
+                    continue
+
+    def submit(self, kind, coro_fn, transform=None):
+        """Start ``coro_fn()`` as a job; its return value becomes the result. Call from the event loop."""
+        self._expire()
+        if self.active() >= self.max_active:
+            self.rejected += 1
+            raise JobLimitReached(f"{self.max_active} jobs already running")
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, kind, transform, self._spool_path(job_id))
+        self._jobs[job.id] = job
+        self._active += 1
+        self.submitted += 1
+
+        async def _run():
+            token = _current.set(job)
+            job.status = RUNNING
+            try:
+                job.finish(result=await coro_fn())
+            except Exception as e:
+                print(f"[Jobs] {job.id} failed:", e)
+                job.finish(error=str(e))
+            finally:
+                _current.reset(token)
+                self._tasks.pop(job.id, None)
+
+        task = asyncio.ensure_future(_run())
+        task.add_done_callback(self._job_ended)  # also runs if the task is cancelled before it starts
+        self._tasks[job.id] = task
+        return job
+
+    def _job_ended(self, _task):
+        self._active -= 1
+
+    def get(self, job_id):
+        self._expire()
+        job = self._jobs.get(job_id)
+        if job is None and self.spool_dir and _JOB_ID.fullmatch(job_id or ""):
+            path = self._spool_path(job_id)
+            if os.path.exists(path):
+                job = SpooledJob(path)
+        return job
+
+    def stats(self):
+        return {
+            "active": self.active(),
+            "stored": len(self._jobs),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "max_active": self.max_active,
+            "spool_dir": self.spool_dir,
+        }
+
+
+def publish(stage, **fields):
+    """Record a partial result on the job bound to this context (no-op outside a job)."""
+    job = _current.get()
+    if job is not None:
+        job.publish(stage, fields)
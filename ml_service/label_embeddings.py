@@ -0,0 +1,123 @@
+"""CLIP text embeddings for the zero-shot tag vocabulary.
+
+Every label is encoded through the prompt templates once (batched), the
+normalized prompt features are averaged per label and the result is kept
+as a ready-to-use ``[num_labels, dim]`` matrix. When the vocabulary changes
+only the new labels are encoded. Optionally the vectors are persisted to
+disk so a restart does not pay the encoding cost again.
+"""
+import os
+import tempfile
+import threading
+
+import torch
+
+PROMPT_TEMPLATES = [
+    'a photo of a {label}',
+    'a photo of the {label}',
+    'a close-up of a {label}',
+    'a picture of a {label}',
+    'the {label}',
+    '{label}'
+]
+
+
+class LabelEmbeddingStore:
+    def __init__(self, model_name, templates=None, cache_path=None, batch_size=256):
+        self.model_name = model_name
+        self.templates = list(templates or PROMPT_TEMPLATES)
+        self.cache_path = cache_path
+        self.batch_size = max(1, int(batch_size))
+        self._vectors = {}  # label -> [dim] float32 tensor on CPU
+        self._matrix_key = None
+        self._matrix = None
+        self._lock = threading.Lock()
+        self.encoded_total = 0
+        self._load()
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            data = torch.load(self.cache_path, map_location="cpu")
+            if data.get("model") != self.model_name or data.get("templates") != self.templates:
+                print("[Label Embeddings] cache ignored (model or templates changed)")
+                return
+            vectors = data["vectors"]
+            for i, label in enumerate(data["labels"]):
+                self._vectors[label] = vectors[i]
+            print(f"[Label Embeddings] loaded {len(self._vectors)} labels from {self.cache_path}")
+        except Exception as e:
+            print("[Label Embeddings] cache load failed:", e)
+
+    def _save(self):
+        if not self.cache_path or not self._vectors:
+            return
+        try:
+            labels = list(self._vectors.keys())
+            payload = {
+                "model": self.model_name,
+                "templates": self.templates,
+                "labels": labels,
+                "vectors": torch.stack([self._vectors[l] for l in labels]),
+            }
+            cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(cache_dir, exist_ok=True)
+            # A private temp file: serve.py workers may all save the shared cache at once
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=os.path.basename(self.cache_path) + ".")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    torch.save(payload, f)
+                os.replace(tmp_path, self.cache_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            print("[Label Embeddings] cache save failed:", e)
+
+    def _encode(self, labels, model, tokenizer, device):
+        """Encode labels through all templates in batched forward passes."""
+        prompts = [t.format(label=lbl) for lbl in labels for t in self.templates]
+        feats = []
+        for start in range(0, len(prompts), self.batch_size):
+            chunk = prompts[start:start + self.batch_size]
+            tok = tokenizer(chunk, padding=True, truncation=True, return_tensors="pt").to(device)
+            with torch.no_grad():
+                tf = model.get_text_features(**tok)
+            tf = tf / tf.norm(dim=-1, keepdim=True)
+            feats.append(tf.float().cpu())
+        per_prompt = torch.cat(feats, dim=0).view(len(labels), len(self.templates), -1)
+        mean_feat = per_prompt.mean(dim=1)
+        mean_feat = mean_feat / mean_feat.norm(dim=-1, keepdim=True)
+        for i, lbl in enumerate(labels):
+            self._vectors[lbl] = mean_feat[i].clone()
+        self.encoded_total += len(labels)
+
+    def get(self, labels, model, tokenizer, device):
+        """Return the ``[len(labels), dim]`` label matrix on ``device``."""
+        key = (tuple(labels), str(device))
+        with self._lock:
+            if key == self._matrix_key:
+                return self._matrix
+            wanted = list(dict.fromkeys(labels))
+            missing = [lbl for lbl in wanted if lbl not in self._vectors]
+            if missing:
+                print(f"[Label Embeddings] encoding {len(missing)} new labels")
+                self._encode(missing, model, tokenizer, device)
+            # Drop labels that left the vocabulary so the store stays bounded
+            wanted_set = set(wanted)
+            stale = [lbl for lbl in self._vectors if lbl not in wanted_set]
+            for lbl in stale:
+                del self._vectors[lbl]
+            if missing or stale:
+                self._save()
+            self._matrix = torch.stack([self._vectors[lbl] for lbl in labels]).to(device)
+            self._matrix_key = key
+            return self._matrix
+
+    def stats(self):
+        return {
+            "labels": len(self._vectors),
+            "encoded_total": self.encoded_total,
+            "persisted": bool(self.cache_path),
+        }
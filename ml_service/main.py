@@ -1,8 +1,8 @@
 import os
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, Form, Header, UploadFile
 from pydantic import BaseModel
-from fastapi.responses import JSONResponse
-from PIL import Image
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import List, Optional
 try:
     from pillow_heif import register_heif_opener
     register_heif_opener()
@@ -10,29 +10,43 @@ try:
 except Exception as _heif_err:
     print("[HEIC] pillow-heif not available:", _heif_err)
 """OCR and vision pipeline
-- PaddleOCR: enabled (lazy init), falls back to Tesseract if unavailable
+- OCR: engine chain from OCR_ENGINES (PaddleOCR by default) on worker processes, optional Tesseract fallback
 - CLIP: tags + 512-d embedding
 - BLIP: caption (used to derive concise description)
 """
 
-# Try to enable PaddleOCR, but keep service working if unavailable
-try:
-    from paddleocr import PaddleOCR  # heavy import
-    _PADDLE_AVAILABLE = True
-except Exception as e:
-    print("[PaddleOCR Disabled]", e)
-    _PADDLE_AVAILABLE = False
 import pytesseract
-import io
-import requests
 import torch
 from transformers import (
     CLIPProcessor, CLIPModel,
     BlipProcessor, BlipForConditionalGeneration
 )
-import cv2
 import numpy as np
 import threading
+from label_embeddings import LabelEmbeddingStore
+from vocabulary import TagVocabulary
+from batching import MicroBatcher
+from lru_cache import LRUCache
+from model_registry import ModelRegistry, memory_breakdown_mb
+from precision import apply_precision
+from image_context import ImageContext, as_context
+from decode import decode_upload, OCR_MAX_SIDE
+from result_cache import ResultCache, make_key
+from dedup import DuplicateIndex, dhash
+from tesseract_engine import TesseractEngine
+from ocr_pool import OCRWorkerPool, OCRQueueFull, OCRTimeout, bind_slots
+from ocr_engines import OCR_ENGINES, parse_chain, load_chain, run_chain
+from functools import partial
+from metrics import REGISTRY, RequestTimings, SharedSlots, bind_timings, record_stage, stage
+from text_gate import get_adaptive_psm, text_presence, regions_bbox
+from vector_index import VectorIndex
+from embedding_codec import encode, encode_fields, negotiate
+from jobs import JobStore, JobLimitReached, publish
+import asyncio
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Point d'accès FastAPI
 app = FastAPI()
@@ -40,204 +54,140 @@ app = FastAPI()
 # 🔁 Load models from local cache (set via environment)
 HF_CACHE = os.getenv("TRANSFORMERS_CACHE", "/root/.cache/huggingface")
 PADDLE_CACHE = os.getenv("PADDLE_MODEL_PATH", "/root/.cache/paddleocr")
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+CLIP_MODEL_ID = "openai/clip-vit-base-patch32"
+BLIP_MODEL_ID = "Salesforce/blip-image-captioning-large"
+# "fp32" (default) or "int8" (dynamic quantization of Linear layers, CPU only); see quality_check.py
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32").lower()
 ENABLE_TESSERACT_FALLBACK = os.getenv("ENABLE_TESSERACT_FALLBACK", "0") == "1"
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))  # OCR worker processes (engine chain: OCR_ENGINES)
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "16"))  # further requests are rejected
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "10"))  # from submission; stuck workers are replaced
+TESSERACT_WORKERS = int(os.getenv("TESSERACT_WORKERS", "2"))  # fewer than the variants, so early stop skips work
+TESSERACT_CONFIDENCE_BAR = float(os.getenv("TESSERACT_CONFIDENCE_BAR", "80"))  # mean word confidence, 0-100
+# "eager": load all models in parallel at startup; "lazy": load each model on first use
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "eager").lower()
+# Optional on-disk cache of template-averaged CLIP label embeddings (e.g. /root/.cache/clip_labels.pt)
+LABEL_EMBED_CACHE = os.getenv("LABEL_EMBED_CACHE") or None
+
+# Caption quality tier: "full" (BLIP-large, 30 tokens), "fast" (short greedy decode, or
+# CAPTION_FAST_MODEL when set) or "auto" (fast when the caption queue would blow the latency budget)
+CAPTION_TIER = os.getenv("CAPTION_TIER", "full").lower()
+CAPTION_FAST_MODEL = os.getenv("CAPTION_FAST_MODEL") or None  # e.g. Salesforce/blip-image-captioning-base
+CAPTION_FAST_MAX_TOKENS = int(os.getenv("CAPTION_FAST_MAX_TOKENS", "12"))
+CAPTION_LATENCY_BUDGET_MS = float(os.getenv("CAPTION_LATENCY_BUDGET_MS", "4000"))
+# /ocr result cache: in-memory LRU plus an optional on-disk tier (RESULT_CACHE_DIR)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR") or None
+RESULT_CACHE_DISK_MB = float(os.getenv("RESULT_CACHE_DISK_MB", "512"))
+# Near-duplicate detection over recent uploads (perceptual hash + CLIP embedding)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_INDEX_SIZE = int(os.getenv("DEDUP_INDEX_SIZE", "2000"))
+DEDUP_SHORT_CIRCUIT_DISTANCE = int(os.getenv("DEDUP_SHORT_CIRCUIT_DISTANCE", "8"))  # of 256 hash bits
+DEDUP_HINT_DISTANCE = int(os.getenv("DEDUP_HINT_DISTANCE", "26"))
+DEDUP_EMBEDDING_THRESHOLD = float(os.getenv("DEDUP_EMBEDDING_THRESHOLD", "0.97"))
+# Item similarity index (/similar, /index/items); memory-mapped under VECTOR_INDEX_DIR
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "/root/.cache/vector_index")
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32").lower()  # float16 halves memory
+VECTOR_INDEX_IVF_LISTS = int(os.getenv("VECTOR_INDEX_IVF_LISTS", "0"))  # 0 = exact search
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+SIMILAR_MAX_K = int(os.getenv("SIMILAR_MAX_K", "100"))
+# Asynchronous /jobs/ocr: concurrent running jobs, and how long finished jobs stay retrievable
+JOBS_MAX_ACTIVE = int(os.getenv("JOBS_MAX_ACTIVE", "32"))
+JOBS_TTL_SECONDS = float(os.getenv("JOBS_TTL_SECONDS", "600"))
+JOBS_DIR = os.getenv("JOBS_DIR") or None  # shared spool so any serve.py worker can answer for any job
+VISION_MAX_BATCH = int(os.getenv("VISION_MAX_BATCH", "8"))
+VISION_MAX_WAIT_MS = float(os.getenv("VISION_MAX_WAIT_MS", "10"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "2"))
+EMBED_TEXT_CACHE_SIZE = int(os.getenv("EMBED_TEXT_CACHE_SIZE", "4096"))
+EMBED_TEXT_MAX_BATCH = int(os.getenv("EMBED_TEXT_MAX_BATCH", "256"))
+VOCAB_URL = os.getenv("VOCAB_URL", "http://backend:3000/api/tags/vocabulary")
+VOCAB_TTL_SECONDS = float(os.getenv("VOCAB_TTL_SECONDS", "60"))
+
+tag_vocabulary = TagVocabulary(VOCAB_URL, ttl=VOCAB_TTL_SECONDS)
+label_store = LabelEmbeddingStore(f"{CLIP_MODEL_ID}@{INFERENCE_PRECISION}", cache_path=LABEL_EMBED_CACHE)
+text_embedding_cache = LRUCache(EMBED_TEXT_CACHE_SIZE)  # normalized query -> embedding
+tesseract_engine = TesseractEngine(TESSERACT_WORKERS, TESSERACT_CONFIDENCE_BAR)
+duplicate_index = DuplicateIndex(
+    DEDUP_INDEX_SIZE, DEDUP_SHORT_CIRCUIT_DISTANCE, DEDUP_HINT_DISTANCE, DEDUP_EMBEDDING_THRESHOLD
+)
+vector_index = VectorIndex(VECTOR_INDEX_DIR, 512, VECTOR_INDEX_DTYPE, VECTOR_INDEX_IVF_LISTS, VECTOR_INDEX_NPROBE)
+analysis_jobs = JobStore(JOBS_MAX_ACTIVE, ttl=JOBS_TTL_SECONDS, spool_dir=JOBS_DIR)
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_DIR, int(RESULT_CACHE_DISK_MB * 1024 * 1024))
+
+# Prometheus metrics (served by /metrics); stage durations are recorded by metrics.stage()
+REQUESTS = REGISTRY.counter("mlsvc_requests", "Analysis requests by endpoint and outcome", ["endpoint", "status"])
+IN_FLIGHT = REGISTRY.gauge("mlsvc_requests_in_flight", "Requests currently being processed", ["endpoint"])
+REQUEST_SECONDS = REGISTRY.histogram("mlsvc_request_seconds", "End-to-end analysis time per image", ["endpoint"])
+RESULTS = REGISTRY.counter("mlsvc_results", "Analysis results by cache outcome", ["cache"])
+OCR_TIMEOUTS = REGISTRY.counter("mlsvc_ocr_timeouts", "OCR jobs that missed their deadline")
+OCR_REJECTIONS = REGISTRY.counter("mlsvc_ocr_rejections", "OCR jobs rejected because the queue was full")
+FALLBACKS = REGISTRY.counter("mlsvc_fallbacks", "Degraded or fallback paths taken", ["kind"])
+QUEUE_DEPTH = REGISTRY.gauge("mlsvc_queue_depth", "Jobs waiting per queue", ["queue"])
+INDEX_ITEMS = REGISTRY.gauge("mlsvc_vector_index_items", "Live item embeddings in the similarity index")
+INDEX_ITEMS.set_function(lambda: len(vector_index))
+SERVER_IN_FLIGHT = REGISTRY.gauge("mlsvc_server_requests_in_flight",
+                                  "Requests being processed by all serve.py workers (this process when run alone)")
+# Under serve.py each worker mirrors its in-flight count into its slot of SERVE_LOAD_FILE, so a scrape
+# of any worker reports the whole server (backfill.py throttles on this)
+_server_load = SharedSlots(os.environ["SERVE_LOAD_FILE"]) if os.getenv("SERVE_LOAD_FILE") else None
+_in_flight = 0
+SERVER_IN_FLIGHT.set_function(lambda: _server_load.total() if _server_load is not None else _in_flight)
+
+
+def _track_in_flight(delta):
+    global _in_flight
+    _in_flight += delta
+    if _server_load is not None:
+        _server_load.set(os.getenv("SERVE_WORKER_INDEX", "0"), _in_flight)
+
+
+def _load_clip():
+    model = CLIPModel.from_pretrained(CLIP_MODEL_ID, cache_dir=HF_CACHE)
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_ID, cache_dir=HF_CACHE)
+    model = apply_precision(model.eval(), INFERENCE_PRECISION, DEVICE).to(DEVICE)
+    return model, processor
+
+
+def _load_blip():
+    processor = BlipProcessor.from_pretrained(BLIP_MODEL_ID, cache_dir=HF_CACHE)
+    model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_ID, cache_dir=HF_CACHE)
+    model = apply_precision(model.eval(), INFERENCE_PRECISION, DEVICE).to(DEVICE)
+    return model, processor
+
+
+def _load_blip_fast():
+    processor = BlipProcessor.from_pretrained(CAPTION_FAST_MODEL, cache_dir=HF_CACHE)
+    model = BlipForConditionalGeneration.from_pretrained(CAPTION_FAST_MODEL, cache_dir=HF_CACHE)
+    model = apply_precision(model.eval(), INFERENCE_PRECISION, DEVICE).to(DEVICE)
+    return model, processor
+
+
+# Every model is loaded exactly once: in parallel at startup ("eager") or on first use ("lazy")
+models = ModelRegistry()
+models.register("clip", _load_clip)
+models.register("blip", _load_blip)
+if CAPTION_FAST_MODEL:
+    models.register("blip_fast", _load_blip_fast)
+
+# OCR engines (PaddleOCR is not thread-safe) run in worker processes that each own their instances.
+# The chain is tried in order until one engine returns text.
+OCR_CHAIN = parse_chain(OCR_ENGINES)
+if not OCR_CHAIN:
+    print(f"[OCR Disabled] none of OCR_ENGINES={OCR_ENGINES!r} is installed")
+ocr_pool = OCRWorkerPool(
+    "ocr", partial(load_chain, OCR_CHAIN), run_chain, OCR_WORKERS, OCR_QUEUE_SIZE, OCR_TIMEOUT_SECONDS
+) if OCR_CHAIN else None
 
-print("Loading CLIP model...")
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32", cache_dir=HF_CACHE)
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32", cache_dir=HF_CACHE)
-
-print("Loading BLIP model...")
-blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-large", cache_dir=HF_CACHE)
-blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large", cache_dir=HF_CACHE)
-
-print("✅ All models loaded successfully!")
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32", cache_dir=HF_CACHE)
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32", cache_dir=HF_CACHE)
-
-blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-large", cache_dir=HF_CACHE)
-blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large", cache_dir=HF_CACHE)
-
-_paddle_ocr_model = None
-
-def run_paddle_ocr(image: Image.Image) -> str:
-    """Use PaddleOCR if available; return empty string on failure."""
-    global _paddle_ocr_model
-    if not _PADDLE_AVAILABLE:
-        return ""
-    try:
-        if _paddle_ocr_model is None:
-            # Use stable 2.x API on CPU to avoid GPU/paddlex issues
-            _paddle_ocr_model = PaddleOCR(use_angle_cls=True, lang='en', use_gpu=False, show_log=False)
-        import numpy as np
-        img_array = np.array(image.convert("RGB"))
-        result = _paddle_ocr_model.ocr(img_array, cls=True)
-        if not result or not result[0]:
-            return ""
-        lines = []
-        for line in result[0]:
-            box, (text, conf) = line
-            if len(text.strip()) >= 3 and conf >= 0.4:
-                lines.append(text)
-        return " ".join(lines)
-    except Exception as e:
-        print("[PaddleOCR Error]", e)
-        return ""
-
-
-def run_paddle_ocr_with_timeout(image: Image.Image, seconds: float = 10.0):
-    result = {"text": "", "timeout": False, "error": None}
-
-    def _worker():
-        try:
-            txt = run_paddle_ocr(image)
-            result["text"] = txt or ""
-        except Exception as e:
-            result["error"] = str(e)
-
-    t = threading.Thread(target=_worker, daemon=True)
-    t.start()
-    t.join(timeout=seconds)
-    if t.is_alive():
-        result["timeout"] = True
-        return "", {"timeout": True}
-    return result["text"], {"timeout": False, "error": result["error"]}
-
-def preprocess_image_for_ocr(image):
-    """
-    Preprocess image to improve OCR accuracy
-    """
-    # Convert PIL to OpenCV format
-    cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    
-    # Convert to grayscale
-    gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-    
-    # Apply different preprocessing techniques
-    processed_images = []
-    
-    # 1. Original grayscale
-    processed_images.append(("original", gray))
-    
-    # 2. Gaussian blur + threshold (good for clean text)
-    blurred = cv2.GaussianBlur(gray, (3, 3), 0)
-    thresh1 = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-    processed_images.append(("otsu", thresh1))
-    
-    # 3. Adaptive threshold (good for varying lighting)
-    adaptive = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                   cv2.THRESH_BINARY, 11, 2)
-    processed_images.append(("adaptive", adaptive))
-    
-    # 4. Morphological operations (clean up noise)
-    kernel = np.ones((2, 2), np.uint8)
-    morph = cv2.morphologyEx(thresh1, cv2.MORPH_CLOSE, kernel)
-    processed_images.append(("morph", morph))
-    
-    return processed_images
-
-def detect_text_regions(image):
-    """
-    Improved text detection using multiple methods
-    Returns (has_text_probability, text_characteristics)
-    """
-    # Convert PIL to OpenCV
-    cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-    image_area = gray.shape[0] * gray.shape[1]
-    
-    # Method 1: Edge density analysis
-    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-    edge_density = np.sum(edges > 0) / image_area
-    
-    # Method 2: Text-like contour analysis  
-    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    text_like_contours = 0
-    line_like_contours = 0
-    
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area < 20:  # Lower threshold for smaller text
-            continue
-            
-        x, y, w, h = cv2.boundingRect(contour)
-        aspect_ratio = w / h if h > 0 else 0
-        
-        # Text characteristics: reasonable aspect ratio and size
-        if 0.1 < aspect_ratio < 15 and area < image_area * 0.3:
-            text_like_contours += 1
-            
-            # Check for line-like text (common in documents)
-            if 2 < aspect_ratio < 12 and h > 5:
-                line_like_contours += 1
-    
-    # Method 3: Horizontal/vertical line detection (text often forms lines)
-    kernel_horizontal = cv2.getStructuringElement(cv2.MORPH_RECT, (25, 1))
-    kernel_vertical = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 25))
-    
-    horizontal_lines = cv2.morphologyEx(edges, cv2.MORPH_OPEN, kernel_horizontal)
-    vertical_lines = cv2.morphologyEx(edges, cv2.MORPH_OPEN, kernel_vertical)
-    
-    h_line_density = np.sum(horizontal_lines > 0) / image_area
-    v_line_density = np.sum(vertical_lines > 0) / image_area
-    
-    # Method 4: Variance analysis (text areas have high variance)
-    variance = cv2.Laplacian(gray, cv2.CV_64F).var()
-    variance_score = min(variance / 1000.0, 1.0)  # Normalize
-    
-    # Combine all indicators
-    contour_score = min(text_like_contours / 8.0, 1.0)
-    line_score = min(line_like_contours / 5.0, 1.0)
-    edge_score = min(edge_density * 100, 1.0)
-    structure_score = min((h_line_density + v_line_density) * 200, 1.0)
-    
-    # Weighted combination favoring multiple positive indicators
-    text_probability = (
-        contour_score * 0.3 + 
-        line_score * 0.25 + 
-        edge_score * 0.2 + 
-        variance_score * 0.15 +
-        structure_score * 0.1
-    )
-    
-    characteristics = {
-        "text_like_contours": text_like_contours,
-        "line_like_contours": line_like_contours,
-        "total_contours": len(contours),
-        "edge_density": edge_density,
-        "variance": variance,
-        "h_line_density": h_line_density,
-        "v_line_density": v_line_density
-    }
-    
-    return text_probability, characteristics
-
-def get_adaptive_psm(text_probability, characteristics):
-    """
-    Choose PSM mode based on detected text characteristics
-    """
-    if text_probability < 0.1:
-        # Very unlikely to have text - use most conservative mode
-        return 8  # Single word
-    elif text_probability < 0.3:
-        # Some text possible - single column
-        return 6  # Single uniform block
-    elif characteristics.get("rectangular_ratio", 0) > 0.5:
-        # Lots of rectangular shapes - likely document/structured text
-        return 3  # Fully automatic page segmentation (no OSD)
-    elif characteristics["text_like_contours"] > 5:
-        # Multiple text regions
-        return 11  # Sparse text
-    else:
-        # Default for moderate text probability
-        return 6  # Single uniform block
 
 def perform_intelligent_ocr(image):
     """
     Fast OCR with basic optimization (keeping under 3 seconds)
     """
+    ctx = as_context(image)
     try:
-        # Quick text detection
-        text_probability, characteristics = detect_text_regions(image)
+        # Quick text detection on a downsampled copy; also locates the text regions
+        text_probability, characteristics, regions = text_presence(ctx.gray)
         
         # If very low probability of text, skip OCR entirely  
         if text_probability < 0.15:
@@ -246,57 +196,17 @@ def perform_intelligent_ocr(image):
         # Get adaptive PSM based on detection
         psm = get_adaptive_psm(text_probability, characteristics)
         
-        # Improved preprocessing with multiple methods
-        cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-        
-        # Try multiple preprocessing approaches
-        results = []
-        
-        # Method 1: Original grayscale with denoising
-        try:
-            denoised = cv2.fastNlMeansDenoising(gray)
-            pil_img1 = Image.fromarray(denoised)
-            text1 = pytesseract.image_to_string(pil_img1, config=f"--oem 3 --psm {psm}").strip()
-            data1 = pytesseract.image_to_data(pil_img1, config=f"--oem 3 --psm {psm}", output_type=pytesseract.Output.DICT)
-            conf1 = [int(c) for c in data1['conf'] if int(c) > 0]
-            avg_conf1 = sum(conf1) / len(conf1) if conf1 else 0
-            results.append((text1, avg_conf1, "denoised"))
-        except:
-            pass
-        
-        # Method 2: OTSU threshold  
-        try:
-            thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-            pil_img2 = Image.fromarray(thresh)
-            text2 = pytesseract.image_to_string(pil_img2, config=f"--oem 3 --psm {psm}").strip()
-            data2 = pytesseract.image_to_data(pil_img2, config=f"--oem 3 --psm {psm}", output_type=pytesseract.Output.DICT)
-            conf2 = [int(c) for c in data2['conf'] if int(c) > 0]
-            avg_conf2 = sum(conf2) / len(conf2) if conf2 else 0
-            results.append((text2, avg_conf2, "otsu"))
-        except:
-            pass
-            
-        # Method 3: Adaptive threshold (for varying lighting)
-        if text_probability > 0.25:
-            try:
-                adaptive = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-                pil_img3 = Image.fromarray(adaptive)
-                text3 = pytesseract.image_to_string(pil_img3, config=f"--oem 3 --psm {psm}").strip()
-                data3 = pytesseract.image_to_data(pil_img3, config=f"--oem 3 --psm {psm}", output_type=pytesseract.Output.DICT)
-                conf3 = [int(c) for c in data3['conf'] if int(c) > 0]
-                avg_conf3 = sum(conf3) / len(conf3) if conf3 else 0
-                results.append((text3, avg_conf3, "adaptive"))
-            except:
-                pass
-        
-        # Choose best result
-        if not results:
-            best_text, best_confidence, best_method = "", 0, "failed"
-        else:
-            # Sort by confidence and text length (prefer longer text if confidence similar)
-            results.sort(key=lambda x: (x[1], len(x[0].strip())), reverse=True)
-            best_text, best_confidence, best_method = results[0]
+        # One image_to_data pass per variant, cheapest first; variants not yet started are skipped
+        # once one clears the bar
+        variants = ("otsu", "denoised", "adaptive") if text_probability > 0.25 else ("otsu", "denoised")
+        gray = ctx.gray
+        crop = None
+        if regions:
+            x0, y0, x1, y1 = regions_bbox(regions, gray.shape)
+            if (x1 - x0) * (y1 - y0) < 0.7 * gray.shape[0] * gray.shape[1]:
+                crop = [int(x0), int(y0), int(x1), int(y1)]
+                gray = gray[y0:y1, x0:x1]
+        (best_text, best_confidence, best_method), engine_info = tesseract_engine.run(gray, psm, variants)
         
         # Improved quality filter (slightly more permissive)
         if best_confidence < 30 or len(best_text.strip()) < 2:
@@ -309,7 +219,10 @@ def perform_intelligent_ocr(image):
             "psm": psm,
             "text_probability": text_probability,
             "confidence": best_confidence,
-            "fast_mode": True
+            "fast_mode": True,
+            "text_regions": len(regions),
+            "crop": crop,
+            **engine_info,
         }
         
         return best_text, best_confidence / 100.0, ocr_info
@@ -318,7 +231,7 @@ def perform_intelligent_ocr(image):
         print(f"Fast OCR failed: {e}")
         # Fallback to simple OCR
         try:
-            text = pytesseract.image_to_string(image, config="--oem 3 --psm 6").strip()
+            text = pytesseract.image_to_string(ctx.image, config="--oem 3 --psm 6").strip()
             return text, 0.5, {"method": "fallback", "error": str(e)}
         except:
             return "", 0.0, {"method": "failed", "error": str(e)}
@@ -369,24 +282,6 @@ def extract_item_description(full_caption, tags=None):
     
     return cleaned
 
-def fetch_tag_vocabulary():
-    try:
-        resp = requests.get("http://backend:3000/api/tags/vocabulary", timeout=5)
-        resp.raise_for_status()
-        return resp.json()
-    except Exception as e:
-        print("[Tag Vocabulary Fetch Error]", e)
-        return []
-
-# Load models at startup (as before)
-print("Loading CLIP model...")
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32", cache_dir=HF_CACHE)
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32", cache_dir=HF_CACHE)
-
-print("Loading BLIP model...")
-blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-large", cache_dir=HF_CACHE)
-blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large", cache_dir=HF_CACHE)
-
 # blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
 
 # Goal	Approach
@@ -395,207 +290,577 @@ blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image
 # Fine-tuned lost & found NLP	Train a BLIP head or use a small LoRA model on annotated items
 # Attribute extraction	Run object detectors (e.g. YOLOv8) and combine with CLIP or captions
 
+
+CAPTION_TIERS = ("full", "fast", "auto")
+
+
+def _caption_model(tier):
+    """(model, processor) used by a concrete tier ("full" or "fast")."""
+    if tier == "fast" and CAPTION_FAST_MODEL:
+        return models.get("blip_fast")
+    return models.get("blip")
+
+
+def _run_caption_batch(pixel_batches, tier="full"):
+    """One batched BLIP generate over per-request pixel tensors."""
+    blip_model, blip_processor = _caption_model(tier)
+    pixel_values = torch.cat(pixel_batches, dim=0).to(DEVICE)
+    max_new_tokens = 30 if tier == "full" else CAPTION_FAST_MAX_TOKENS
+    with torch.no_grad():
+        if tier == "full":
+            blip_output = blip_model.generate(pixel_values=pixel_values, max_new_tokens=max_new_tokens)
+        else:
+            blip_output = blip_model.generate(pixel_values=pixel_values, max_new_tokens=max_new_tokens, num_beams=1, do_sample=False)
+    return [blip_processor.tokenizer.decode(out, skip_special_tokens=True).strip() for out in blip_output]
+
+
+def _run_clip_image_batch(pixel_batches):
+    """One batched CLIP image forward pass; returns normalized [1, dim] features per request."""
+    clip_model = models.get("clip")[0]
+    pixel_values = torch.cat(pixel_batches, dim=0).to(DEVICE)
+    with torch.no_grad():
+        image_features = clip_model.get_image_features(pixel_values=pixel_values)
+    image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+    return list(image_features.split(1, dim=0))
+
+
+# Dedicated executors keep blocking work off the event loop.
+# Tesseract fallback calls; the engine itself spreads variants over worker processes.
+_ocr_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr")
+# Decode, processor resize/normalize and label-matrix lookups
+_cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+
+caption_batchers = {
+    "full": MicroBatcher("blip_caption", lambda b: _run_caption_batch(b, "full"), VISION_MAX_BATCH, VISION_MAX_WAIT_MS),
+    "fast": MicroBatcher("blip_caption_fast", lambda b: _run_caption_batch(b, "fast"), VISION_MAX_BATCH, VISION_MAX_WAIT_MS),
+}
+clip_image_batcher = MicroBatcher("clip_image", _run_clip_image_batch, VISION_MAX_BATCH, VISION_MAX_WAIT_MS)
+for _batcher in (*caption_batchers.values(), clip_image_batcher):
+    QUEUE_DEPTH.set_function(_batcher.queue_depth, queue=_batcher.name)
+if ocr_pool is not None:
+    QUEUE_DEPTH.set_function(ocr_pool.queue_depth, queue="ocr")
+QUEUE_DEPTH.set_function(analysis_jobs.active, queue="jobs")
+
+
 @app.get("/health")
 def health_check():
     """Health check endpoint to verify service is ready"""
-    if clip_model is not None and clip_processor is not None and blip_model is not None:
-        return {"status": "ready", "models_loaded": True}
+    ready = MODEL_LOAD_MODE == "lazy" or models.all_loaded(["clip", "blip"])
+    if ready:
+        return {
+            "status": "ready",
+            "models_loaded": models.all_loaded(),
+            "models": models.stats(),
+            "worker": {"pid": os.getpid(), "index": os.getenv("SERVE_WORKER_INDEX"),
+                       "torch_threads": torch.get_num_threads(), "memory_mb": memory_breakdown_mb()},
+            "ocr_pool": ocr_pool.stats() if ocr_pool is not None else None,
+            "precision": INFERENCE_PRECISION,
+            "label_embeddings": label_store.stats(),
+            "vocabulary": tag_vocabulary.stats(),
+            "batching": {b.name: b.stats() for b in (*caption_batchers.values(), clip_image_batcher)},
+            "caption_tier": CAPTION_TIER,
+            "embed_text_cache": text_embedding_cache.stats(),
+            "result_cache": result_cache.stats(),
+            "duplicates": duplicate_index.stats(),
+            "vector_index": vector_index.stats(),
+            "jobs": analysis_jobs.stats(),
+            "tesseract": tesseract_engine.stats(),
+        }
     else:
-        return {"status": "loading", "models_loaded": False}
+        return {"status": "loading", "models_loaded": False, "models": models.stats()}
 
 
 class TextPayload(BaseModel):
     text: str
+    embedding_encoding: Optional[str] = None  # json (default), f32, f16 or i8; see embedding_codec.py
+
+
+class TextBatchPayload(BaseModel):
+    texts: List[str]
+    embedding_encoding: Optional[str] = None
+
+
+def _normalize_query(text: str) -> str:
+    # CLIP's tokenizer lowercases and collapses whitespace, so this key is embedding-safe
+    return " ".join((text or "").lower().split())
+
+
+def encode_texts(texts):
+    """Return unit-length 512-d CLIP text embeddings (lists of floats) for normalized texts.
+    Cached texts are served from the LRU; the rest are encoded in one forward pass.
+    """
+    results = [text_embedding_cache.get(t) for t in texts]
+    missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+    if missing:
+        clip_model, clip_processor = models.get("clip")
+        tok = clip_processor.tokenizer(missing, padding=True, truncation=True, return_tensors="pt").to(DEVICE)
+        with torch.no_grad():
+            tf = clip_model.get_text_features(**tok)
+        tf = tf / tf.norm(dim=-1, keepdim=True)
+        encoded = dict(zip(missing, tf.detach().cpu().tolist()))
+        for t, emb in encoded.items():
+            text_embedding_cache.put(t, emb)
+        results = [r if r is not None else encoded[t] for t, r in zip(texts, results)]
+    return results
+
 
 @app.post("/embed_text")
-def embed_text(payload: TextPayload):
+def embed_text(payload: TextPayload, accept: Optional[str] = Header(None)):
     """Return a 512-d CLIP text embedding for the provided text.
     Normalizes the vector to unit length to match how image features are stored/compared.
     """
     try:
-        txt = (payload.text or "").strip()
+        encoding = negotiate(payload.embedding_encoding, accept)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    try:
+        txt = _normalize_query(payload.text)
         if not txt:
             return JSONResponse(status_code=400, content={"error": "text is required"})
 
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        _ = clip_model.to(device)
-
-        tok = clip_processor.tokenizer([txt], padding=True, truncation=True, return_tensors="pt").to(device)
-        with torch.no_grad():
-            tf = clip_model.get_text_features(**tok)
-        tf = tf / tf.norm(dim=-1, keepdim=True)
-        emb = tf.squeeze(0).detach().cpu().tolist()
+        emb = encode_texts([txt])[0]
         # Ensure correct size
         if not isinstance(emb, list) or len(emb) != 512:
             return JSONResponse(status_code=500, content={"error": "invalid embedding size", "size": len(emb) if isinstance(emb, list) else None})
-        return {"embedding": emb}
+        return {"embedding": encode(emb, encoding)}
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": "embedding failed", "details": str(e)})
+
+
+@app.post("/embed_text/batch")
+def embed_text_batch(payload: TextBatchPayload, accept: Optional[str] = Header(None)):
+    """Return 512-d CLIP text embeddings for a list of texts, in order, encoded in one pass."""
+    try:
+        encoding = negotiate(payload.embedding_encoding, accept)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    try:
+        texts = [_normalize_query(t) for t in (payload.texts or [])]
+        if not texts or not all(texts):
+            return JSONResponse(status_code=400, content={"error": "texts must be a non-empty list of non-empty strings"})
+        if len(texts) > EMBED_TEXT_MAX_BATCH:
+            return JSONResponse(status_code=400, content={"error": "too many texts", "max": EMBED_TEXT_MAX_BATCH})
+        return {"embeddings": [encode(e, encoding) for e in encode_texts(texts)]}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": "embedding failed", "details": str(e)})
 
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of request, stage, cache, fallback and queue metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+class IndexItem(BaseModel):
+    id: str
+    organization_id: int
+    embedding: List[float]
+
+
+class IndexItemsPayload(BaseModel):
+    items: List[IndexItem]
+
+
+class SimilarPayload(BaseModel):
+    organization_id: Optional[int] = None
+    all_organizations: bool = False  # explicit opt-in for internal callers; otherwise organization_id is required
+    embedding: Optional[List[float]] = None
+    text: Optional[str] = None
+    k: int = 10
+    exclude_ids: List[str] = []
+
+
+def _organization_scope_error(organization_id, all_organizations):
+    if organization_id is None and not all_organizations:
+        return JSONResponse(status_code=400, content={
+            "error": "organization_id is required (pass all_organizations=true to search every organization)"})
+    if organization_id is not None and all_organizations:
+        return JSONResponse(status_code=400, content={"error": "organization_id and all_organizations are exclusive"})
+    return None
+
+
+def _similar_response(embedding, organization_id, k, exclude_ids=()):
+    k = max(1, min(int(k), SIMILAR_MAX_K))
+    t0 = time.perf_counter()
+    with stage("vector_search"):
+        hits = vector_index.search(embedding, k, organization_id, exclude_ids)[0]
+    return {
+        "results": [{"id": item_id, "score": round(score, 6)} for item_id, score in hits],
+        "search_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+        "mode": vector_index.stats()["mode"],
+    }
+
+
+@app.post("/index/items")
+def index_items(payload: IndexItemsPayload):
+    """Add or replace item embeddings in the similarity index (called by the backend on item create)."""
+    try:
+        written = vector_index.add((i.id, i.organization_id, i.embedding) for i in payload.items)
+        return {"indexed": written, "items": len(vector_index)}
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+
+@app.delete("/index/items/{item_id}")
+def delete_index_item(item_id: str):
+    return {"deleted": vector_index.delete([item_id]), "items": len(vector_index)}
+
+
+@app.post("/similar")
+def similar(payload: SimilarPayload):
+    """Nearest indexed items to an embedding or a text query, within one organization."""
+    scope_error = _organization_scope_error(payload.organization_id, payload.all_organizations)
+    if scope_error is not None:
+        return scope_error
+    try:
+        if payload.embedding is not None:
+            embedding = payload.embedding
+        elif _normalize_query(payload.text or ""):
+            embedding = encode_texts([_normalize_query(payload.text)])[0]
+        else:
+            return JSONResponse(status_code=400, content={"error": "embedding or text is required"})
+        if len(embedding) != 512:
+            return JSONResponse(status_code=400, content={"error": "invalid embedding size", "size": len(embedding)})
+        return _similar_response(embedding, payload.organization_id, payload.k, payload.exclude_ids)
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": "similarity search failed", "details": str(e)})
+
+
+@app.post("/similar/image")
+async def similar_image(file: UploadFile = File(...), organization_id: Optional[int] = Form(None), k: int = Form(10),
+                        all_organizations: bool = Form(False)):
+    """Search-by-photo: CLIP-embed the upload (no OCR or captioning) and query the index."""
+    scope_error = _organization_scope_error(organization_id, all_organizations)
+    if scope_error is not None:
+        return scope_error
+    try:
+        contents = await file.read()
+        loop = asyncio.get_running_loop()
+        with stage("decode"):
+            ctx = await loop.run_in_executor(_cpu_executor, decode_image, contents)
+        clip_processor = models.get("clip")[1]
+        pixels = await loop.run_in_executor(
+            _cpu_executor, ctx.pixels, "clip",
+            lambda img: clip_processor(images=img, return_tensors="pt")["pixel_values"],
+        )
+        with stage("clip_image"):
+            features = await asyncio.wrap_future(clip_image_batcher.submit(pixels))
+        embedding = features.squeeze(0).detach().cpu().float().tolist()
+        # A full scan (or a remap after another process wrote the index) must not block the loop
+        return await loop.run_in_executor(_cpu_executor, _similar_response, embedding, organization_id, k)
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": "similarity search failed", "details": str(e)})
+
+
+@app.get("/embed_text/stats")
+def embed_text_stats():
+    return text_embedding_cache.stats()
+
 @app.get("/tags")
 def get_tags():
     return ['wallet', 'passport', 'phone', 'backpack', 'laptop']  # To be fetched from the DB in a later step
 
-@app.post("/ocr")
-async def perform_ocr(file: UploadFile = File(...)):
-    try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+def decode_image(contents: bytes) -> ImageContext:
+    """Reduced-resolution decode: bounded OCR image plus a model-sized vision image."""
+    return decode_upload(contents)
+
 
-        # OCR step: prefer PaddleOCR; optionally fall back to Tesseract
-        text, paddle_meta = run_paddle_ocr_with_timeout(image, seconds=10.0)
-        ocr_info = {"method": "paddleocr", **paddle_meta}
-        if not text and ENABLE_TESSERACT_FALLBACK:
-            text, ocr_confidence, extra = perform_intelligent_ocr(image)
+async def _ocr_stage(image: ImageContext):
+    """OCR step: engine chain on the worker pool; optionally fall back to Tesseract on the OCR executor."""
+    loop = asyncio.get_running_loop()
+    try:
+        text, ocr_info = "", {"method": OCR_CHAIN[0] if OCR_CHAIN else None, "timeout": False, "error": None}
+        if ocr_pool is not None:
+            try:
+                with stage("ocr"):
+                    result = await ocr_pool.run(image.rgb)
+                text = result["text"]
+                ocr_info.update(method=result["engine"], attempts=result["attempts"], lines=result["lines"])
+                if len(result["attempts"]) > 1:
+                    FALLBACKS.inc(kind="ocr_engine")
+            except OCRTimeout as e:
+                OCR_TIMEOUTS.inc()
+                ocr_info.update(timeout=True, error=str(e))
+            except OCRQueueFull as e:
+                OCR_REJECTIONS.inc()
+                ocr_info.update(rejected=True, error=str(e))
+            except Exception as e:
+                print("[OCR Error]", e)
+                ocr_info["error"] = str(e)
+        # A rejected job means OCR is saturated: don't pile the fallback on top
+        if not text and ENABLE_TESSERACT_FALLBACK and not ocr_info.get("rejected"):
+            FALLBACKS.inc(kind="tesseract")
+            with stage("ocr_fallback"):
+                text, ocr_confidence, extra = await loop.run_in_executor(_ocr_executor, perform_intelligent_ocr, image)
             ocr_info.update(extra)
+        return text, ocr_info
+    except Exception as e:
+        print("[OCR Stage Error]", e)
+        return "", {"method": "failed", "error": str(e)}
+
+
+def resolve_caption_tier(requested=None):
+    """Map a requested tier (or CAPTION_TIER) to "full" or "fast".
+    "auto" picks "fast" when the expected wait for a full caption exceeds the latency budget.
+    """
+    tier = (requested or CAPTION_TIER or "full").lower()
+    if tier not in CAPTION_TIERS:
+        tier = "full"
+    if tier != "auto":
+        return tier
+    full = caption_batchers["full"]
+    batches_ahead = full.queue_depth() // full.max_batch_size + 1
+    expected_ms = batches_ahead * (full.avg_batch_ms or 0.0)
+    if expected_ms > CAPTION_LATENCY_BUDGET_MS:
+        FALLBACKS.inc(kind="caption_fast")
+        return "fast"
+    return "full"
+
+
+def _preprocess_vision(ctx: ImageContext, tier="full"):
+    # Processors resize the shared, already-downscaled vision image; tensors are memoized on the context
+    blip_processor = _caption_model(tier)[1]
+    clip_processor = models.get("clip")[1]
+    blip_key = "blip_fast" if tier == "fast" and CAPTION_FAST_MODEL else "blip"
+    blip_pixels = ctx.pixels(blip_key, lambda img: blip_processor(images=img, return_tensors="pt")["pixel_values"])
+    clip_pixels = ctx.pixels("clip", lambda img: clip_processor(images=img, return_tensors="pt")["pixel_values"])
+    return blip_pixels, clip_pixels
+
+
+async def _vision_stage(ctx: ImageContext, tier="full"):
+    """BLIP caption and normalized CLIP image features.
+    Preprocessing runs on the CPU executor; inference is micro-batched with concurrent requests.
+    """
+    loop = asyncio.get_running_loop()
+    with stage("vision_preprocess"):
+        blip_pixels, clip_pixels = await loop.run_in_executor(_cpu_executor, _preprocess_vision, ctx, tier)
+    # Caption and CLIP run concurrently; both are timed from submission (includes batching wait)
+    submitted = time.perf_counter()
+    caption_future = caption_batchers[tier].submit(blip_pixels)
+    try:
+        image_features = await asyncio.wrap_future(clip_image_batcher.submit(clip_pixels))
+    except Exception as e_img:
+        print("[CLIP Image Features Error]", e_img)
+        raise
+    record_stage("clip_image", time.perf_counter() - submitted)
+    full_caption = await asyncio.wrap_future(caption_future)
+    record_stage("caption", time.perf_counter() - submitted)
+    return full_caption, image_features
+
+
+def _publish_ocr(task):
+    if not task.cancelled():
+        text, ocr_info = task.result()
+        publish("ocr", text=text, ocr_info=ocr_info)
+
+
+async def analyze_image(image, tier: Optional[str] = None, ocr_text: Optional[str] = None) -> dict:
+    """Run OCR, captioning, tagging and embedding for one decoded image (PIL image or ImageContext).
+    Returns the response body shared by /ocr and /ocr/batch. Passing ``ocr_text`` (e.g. the stored
+    text when backfilling) skips OCR and uses it for tag boosting instead.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = as_context(image)
+    caption_tier = resolve_caption_tier(tier)
+
+    if ocr_text is not None:
+        ocr_task = loop.create_future()
+        ocr_task.set_result((ocr_text, {"method": "provided", "timeout": False, "error": None}))
+    else:
+        # OCR and vision run concurrently on their own workers; they join before tag boosting
+        ocr_task = asyncio.ensure_future(_ocr_stage(ctx))
+        # Job mode: OCR text goes out as soon as it is ready, ahead of the vision results
+        ocr_task.add_done_callback(_publish_ocr)
+
+    # ⏬ Tag labels from the local vocabulary cache (normalized once per version)
+    with stage("vocabulary"):
+        candidate_labels = await loop.run_in_executor(_cpu_executor, tag_vocabulary.labels)
+
+    # Generate caption (BLIP), tags (CLIP zero-shot), and embedding (CLIP)
+    try:
+        device = DEVICE
+        print(f"[Vision] start device={device}")
+
+        full_caption, image_features = await _vision_stage(ctx, caption_tier)
+        publish("caption", full_caption=full_caption, caption_tier=caption_tier)
 
-        # ⏬ Get up-to-date tag labels from DB
-        candidate_labels = fetch_tag_vocabulary()
-
-        # 📌 If empty, avoid crash
-        if not candidate_labels:
-            candidate_labels = ["item", "object", "thing"]
-
-        # Ensure candidate_labels is a flat list of strings and normalize
-        if isinstance(candidate_labels, list) and len(candidate_labels) > 0:
-            flat_labels = []
-            for label in candidate_labels:
-                if isinstance(label, dict) and 'name' in label:
-                    flat_labels.append(label['name'])
-                elif isinstance(label, str):
-                    flat_labels.append(label)
-                else:
-                    flat_labels.append(str(label))
-            # Normalize basic plural forms and casing
-            def _normalize(lbl: str) -> str:
-                s = lbl.strip().lower()
-                if s.endswith('ies') and len(s) > 3:
-                    return s[:-3] + 'y'
-                if s.endswith('es') and len(s) > 2:
-                    return s[:-2]
-                if s.endswith('s') and len(s) > 1:
-                    return s[:-1]
-                return s
-            candidate_labels = [_normalize(x) for x in flat_labels]
-
-        # Generate caption (BLIP), tags (CLIP zero-shot), and embedding (CLIP)
+        # Zero-shot tagging with prompt ensembling per label (cached label embeddings)
         try:
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            print(f"[Vision] start device={device}")
-            # Move models to target device (no-op if already there)
-            _ = clip_model.to(device)
-            _ = blip_model.to(device)
-            print("[Vision] models ready")
-
-            # BLIP captioning
-            blip_inputs = blip_processor(images=image, return_tensors="pt").to(device)
-            with torch.no_grad():
-                blip_output = blip_model.generate(**blip_inputs, max_new_tokens=30)
-            full_caption = blip_processor.tokenizer.decode(blip_output[0], skip_special_tokens=True).strip()
-
-            # CLIP image features
-            try:
-                clip_image_inputs = clip_processor(images=image, return_tensors="pt").to(device)
-                with torch.no_grad():
-                    image_features = clip_model.get_image_features(**clip_image_inputs)
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-            except Exception as e_img:
-                print("[CLIP Image Features Error]", e_img)
-                raise
-
-            # Zero-shot tagging with prompt ensembling per label
-            try:
-                templates = [
-                    'a photo of a {label}',
-                    'a photo of the {label}',
-                    'a close-up of a {label}',
-                    'a picture of a {label}',
-                    'the {label}',
-                    '{label}'
-                ]
-                feats_per_label = []
-                for lbl in candidate_labels:
-                    per_prompts = [t.format(label=lbl) for t in templates]
-                    # Encode each prompt and average their normalized features
-                    per_feats = []
-                    for prompt in per_prompts:
-                        tok = clip_processor.tokenizer([prompt], padding=True, truncation=True, return_tensors="pt").to(device)
-                        with torch.no_grad():
-                            tf = clip_model.get_text_features(**tok)
-                        tf = tf / tf.norm(dim=-1, keepdim=True)
-                        per_feats.append(tf)
-                    mean_feat = torch.mean(torch.cat(per_feats, dim=0), dim=0, keepdim=True)
-                    mean_feat = mean_feat / mean_feat.norm(dim=-1, keepdim=True)
-                    feats_per_label.append(mean_feat)
-                text_features = torch.cat(feats_per_label, dim=0)  # [num_labels, dim]
-            except Exception as e_txt:
-                print("[CLIP Text Features Error]", e_txt)
-                raise
-
-            # Similarity and probabilities with caption/OCR boosting
-            try:
-                logits_per_image = image_features @ text_features.T
-                probs = torch.softmax(logits_per_image, dim=-1).squeeze(0)
-            except Exception as e_sim:
-                print("[CLIP Similarity Error]", e_sim)
-                raise
+            clip_model, clip_processor = models.get("clip")
+            with stage("label_embeddings"):
+                text_features = await loop.run_in_executor(
+                    _cpu_executor, label_store.get, candidate_labels, clip_model, clip_processor.tokenizer, device
+                )  # [num_labels, dim]
+        except Exception as e_txt:
+            print("[CLIP Text Features Error]", e_txt)
+            raise
+
+        text, ocr_info = await ocr_task
+
+        # Similarity and probabilities with caption/OCR boosting
+        tagging_started = time.perf_counter()
+        try:
+            logits_per_image = image_features @ text_features.T
+            probs = torch.softmax(logits_per_image, dim=-1).squeeze(0)
+        except Exception as e_sim:
+            print("[CLIP Similarity Error]", e_sim)
+            raise
+
+        # Boost labels mentioned in BLIP caption, concise description, or OCR text
+        try:
+            caption_l = (full_caption or '').lower()
+            desc_l = (concise_description or '').lower()
+            ocr_l = (text or '').lower()
+            weights = []
+            for lbl in candidate_labels:
+                w = 1.0
+                if lbl in caption_l:
+                    w += 0.35
+                if lbl in desc_l:
+                    w += 0.25
+                if lbl in ocr_l or (lbl + 's') in ocr_l:
+                    w += 0.20
+                weights.append(w)
+            w_t = torch.tensor(weights, device=probs.device, dtype=probs.dtype)
+            adj = probs * w_t
+            adj = adj / (adj.sum() + 1e-9)
+        except Exception as _e_boost:
+            adj = probs
+
+        # Pick only the single best tag (most probable after boosting)
+        try:
+            top_idx = int(torch.argmax(adj).item())
+            tags = [candidate_labels[top_idx]]
+            tag_scores = [float(adj[top_idx].item())]
+        except Exception:
+            tags = [candidate_labels[0]] if candidate_labels else ["item"]
+            tag_scores = [1.0]
+        record_stage("tagging", time.perf_counter() - tagging_started)
+
+        # Description: concise form of BLIP caption using tags for context
+        concise_description = extract_item_description(full_caption, tags)
+        caption_confidence = 1.0
+        publish("tags", tags=tags, tag_scores=tag_scores,
+                description=concise_description, description_score=caption_confidence)
+
+        # 512-dim embedding vector from CLIP (ViT-B/32)
+        image_embedding = image_features.squeeze(0).detach().cpu().tolist()
+        publish("embedding", embedding=image_embedding)
+    except Exception as e:
+        print(f"[Vision Pipeline Fallback] {e}")
+        FALLBACKS.inc(kind="vision")
+        # Fallbacks if models or inference fail
+        tags = ["item"]
+        tag_scores = [0.5]
+        full_caption = "image"
+        concise_description = "item"
+        caption_confidence = 1.0
+        image_embedding = [0.0] * 512
+
+    text, ocr_info = await ocr_task
+
+    return {
+        "description": concise_description,
+        "description_score": caption_confidence,
+        "text": text,
+        "tags": tags,
+        "tag_scores": tag_scores,
+        "embedding": image_embedding,
+        "ocr_info": ocr_info,  # Include OCR diagnostic information
+        "full_caption": full_caption,  # Keep original for debugging if needed
+        "caption_tier": caption_tier,
+        "decode_info": ctx.decode_info
+    }
+
+
+def _result_cache_key(image_id: str, caption_tier: str) -> str:
+    return make_key(
+        image_id.encode("ascii"),
+        CLIP_MODEL_ID, BLIP_MODEL_ID, CAPTION_FAST_MODEL, INFERENCE_PRECISION, caption_tier,
+        tag_vocabulary.fingerprint, OCR_MAX_SIDE, ENABLE_TESSERACT_FALLBACK, ",".join(OCR_CHAIN),
+    )
+
+
+def _is_cacheable(result: dict) -> bool:
+    # Never pin a degraded answer: OCR timeouts/errors or the vision fallback (zero embedding)
+    info = result.get("ocr_info") or {}
+    return not info.get("timeout") and not info.get("error") and any(result.get("embedding") or [])
 
-            # Boost labels mentioned in BLIP caption, concise description, or OCR text
-            try:
-                caption_l = (full_caption or '').lower()
-                desc_l = (concise_description or '').lower()
-                ocr_l = (text or '').lower()
-                weights = []
-                for lbl in candidate_labels:
-                    w = 1.0
-                    if lbl in caption_l:
-                        w += 0.35
-                    if lbl in desc_l:
-                        w += 0.25
-                    if lbl in ocr_l or (lbl + 's') in ocr_l:
-                        w += 0.20
-                    weights.append(w)
-                w_t = torch.tensor(weights, device=probs.device, dtype=probs.dtype)
-                adj = probs * w_t
-                adj = adj / (adj.sum() + 1e-9)
-            except Exception as _e_boost:
-                adj = probs
-
-            # Pick only the single best tag (most probable after boosting)
-            try:
-                top_idx = int(torch.argmax(adj).item())
-                tags = [candidate_labels[top_idx]]
-                tag_scores = [float(adj[top_idx].item())]
-            except Exception:
-                tags = [candidate_labels[0]] if candidate_labels else ["item"]
-                tag_scores = [1.0]
-
-            # Description: concise form of BLIP caption using tags for context
-            concise_description = extract_item_description(full_caption, tags)
-            caption_confidence = 1.0
-
-            # 512-dim embedding vector from CLIP (ViT-B/32)
-            image_embedding = image_features.squeeze(0).detach().cpu().tolist()
-        except Exception as e:
-            print(f"[Vision Pipeline Fallback] {e}")
-            # Fallbacks if models or inference fail
-            tags = ["item"]
-            tag_scores = [0.5]
-            full_caption = "image"
-            concise_description = "item"
-            caption_confidence = 1.0
-            image_embedding = [0.0] * 512
-
-        return JSONResponse(content={
-            "description": concise_description,
-            "description_score": caption_confidence,
-            "text": text,
-            "tags": tags,
-            "tag_scores": tag_scores,
-            "embedding": image_embedding,
-            "ocr_info": ocr_info,  # Include OCR diagnostic information
-            "full_caption": full_caption  # Keep original for debugging if needed
-        })
+
+async def analyze_upload(contents: bytes, tier: Optional[str] = None, organization_id: Optional[int] = None) -> dict:
+    """Cached analysis of raw upload bytes.
+    An exact-bytes hit skips decode and the whole pipeline; a near-identical photo seen recently
+    (perceptual hash) reuses its result. Otherwise the full pipeline runs and the response carries
+    a possible_duplicate_of hint when a recent upload looks the same. Near-duplicate reuse and
+    hints only consider earlier uploads of the same organization_id.
+    """
+    loop = asyncio.get_running_loop()
+    caption_tier = resolve_caption_tier(tier)
+    with stage("cache_lookup"):
+        image_id = await loop.run_in_executor(_cpu_executor, lambda: hashlib.sha256(contents).hexdigest())
+        key = _result_cache_key(image_id, caption_tier)
+        cached, where = await loop.run_in_executor(_cpu_executor, result_cache.get, key)
+    if cached is not None:
+        RESULTS.inc(cache=where)
+        hint = {"image_id": image_id, "hash_distance": 0, "exact": True}
+        return {**cached, "image_id": image_id, "cache": where, "possible_duplicate_of": hint}
+
+    with stage("decode"):
+        ctx = await loop.run_in_executor(_cpu_executor, decode_image, contents)
+    if DEDUP_ENABLED:
+        with stage("dedup"):
+            phash = await loop.run_in_executor(_cpu_executor, ctx.pixels, "dhash", dhash)
+            aspect = ctx.size[0] / float(ctx.size[1])
+            variant = (caption_tier, tag_vocabulary.fingerprint)
+            reused, hint = duplicate_index.find_exact_reuse(phash, aspect, variant, organization_id)
+        if reused is not None:
+            RESULTS.inc(cache="near_duplicate")
+            return {**reused, "image_id": image_id, "cache": "near_duplicate", "possible_duplicate_of": hint}
+
+    result = await analyze_image(ctx, caption_tier)
+    hint = None
+    if _is_cacheable(result):
+        if DEDUP_ENABLED:
+            embedding = np.asarray(result["embedding"], dtype=np.float32)
+            hint = duplicate_index.find_similar(phash, embedding, organization_id)
+            duplicate_index.add(image_id, phash, aspect, embedding, result, variant, organization_id)
+        await loop.run_in_executor(_cpu_executor, result_cache.put, key, result)
+    RESULTS.inc(cache="miss")
+    return {**result, "image_id": image_id, "cache": "miss", "possible_duplicate_of": hint}
+
+
+async def instrumented_upload(endpoint: str, contents: bytes, tier: Optional[str] = None, timings: bool = False,
+                              organization_id: Optional[int] = None) -> dict:
+    """``analyze_upload`` with request metrics; adds the per-stage breakdown when ``timings`` is set."""
+    request_timings = RequestTimings()
+    IN_FLIGHT.inc(endpoint=endpoint)
+    _track_in_flight(1)
+    status = "error"
+    try:
+        with bind_timings(request_timings):
+            result = await analyze_upload(contents, tier, organization_id)
+        status = "ok"
+    finally:
+        IN_FLIGHT.dec(endpoint=endpoint)
+        _track_in_flight(-1)
+        REQUESTS.inc(endpoint=endpoint, status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - request_timings.started, endpoint=endpoint)
+    if timings:
+        result = {**result, "timings": request_timings.to_dict()}
+    return result
+
+
+@app.post("/ocr")
+async def perform_ocr(file: UploadFile = File(...), tier: Optional[str] = Form(None), timings: bool = Form(False),
+                      embedding_encoding: Optional[str] = Form(None), organization_id: Optional[int] = Form(None),
+                      accept: Optional[str] = Header(None)):
+    try:
+        encoding = negotiate(embedding_encoding, accept)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    try:
+        contents = await file.read()
+        return JSONResponse(content=encode_fields(await instrumented_upload("ocr", contents, tier, timings, organization_id), encoding))
 
     except Exception as e:
         print(f"Error in OCR processing: {e}")
@@ -612,12 +877,104 @@ async def perform_ocr(file: UploadFile = File(...)):
             }
         )
 
-# Warmup PaddleOCR at startup to pre-download models and avoid first-request latency
+@app.post("/ocr/batch")
+async def perform_ocr_batch(files: List[UploadFile] = File(...), tier: Optional[str] = Form(None),
+                            timings: bool = Form(False), embedding_encoding: Optional[str] = Form(None),
+                            organization_id: Optional[int] = Form(None), accept: Optional[str] = Header(None)):
+    """Analyze many photos in one call.
+    Files are decoded concurrently and their vision stages share batched model calls.
+    Streams one NDJSON line per item ({"index", "filename", ...same fields as /ocr}) as each completes.
+    """
+    try:
+        encoding = negotiate(embedding_encoding, accept)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    uploads = [(i, f.filename, await f.read()) for i, f in enumerate(files)]
+    # One OCR job per pool worker at a time: the rest of a large batch waits here instead of
+    # overflowing OCR_QUEUE_SIZE or spending its deadline in the pool's queue
+    ocr_slots = asyncio.Semaphore(ocr_pool.size) if ocr_pool is not None else None
+
+    async def _one(index, filename, contents):
+        try:
+            with bind_slots(ocr_slots):
+                result = encode_fields(await instrumented_upload("ocr_batch", contents, tier, timings, organization_id), encoding)
+        except Exception as e:
+            print(f"Error in batch OCR processing ({filename}): {e}")
+            result = {
+                "error": "OCR processing failed",
+                "details": str(e),
+                "text": "",
+                "tags": [],
+                "description": "",
+                "embedding": [],
+                "ocr_info": {"error": str(e)}
+            }
+        return {"index": index, "filename": filename, **result}
+
+    async def _stream():
+        tasks = [asyncio.ensure_future(_one(*u)) for u in uploads]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield json.dumps(await done) + "\n"
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs/ocr", status_code=202)
+async def submit_ocr_job(file: UploadFile = File(...), tier: Optional[str] = Form(None), timings: bool = Form(False),
+                         embedding_encoding: Optional[str] = Form(None), organization_id: Optional[int] = Form(None),
+                         accept: Optional[str] = Header(None)):
+    """Start an /ocr analysis and return its job id immediately.
+    Partial results (ocr, caption, tags, embedding) are published as each stage finishes:
+    poll GET /jobs/{id} or follow GET /jobs/{id}/events (server-sent events).
+    """
+    try:
+        encoding = negotiate(embedding_encoding, accept)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    contents = await file.read()
+    try:
+        job = analysis_jobs.submit(
+            "ocr", lambda: instrumented_upload("ocr_job", contents, tier, timings, organization_id),
+            transform=lambda fields: encode_fields(fields, encoding),
+        )
+    except JobLimitReached as e:
+        return JSONResponse(status_code=429, content={"error": "too many running jobs", "details": str(e)})
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "unknown or expired job"})
+    return job.snapshot()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, last_event_id: Optional[str] = Header(None)):
+    """Server-sent events: one event per stage (``event: ocr|caption|tags|embedding``), then ``done`` or ``error``."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "unknown or expired job"})
+    after = int(last_event_id) if (last_event_id or "").isdigit() else -1
+    return StreamingResponse(job.events(after), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# Load models and start (and warm up) the OCR workers at startup to avoid first-request latency
 @app.on_event("startup")
 def warmup_models():
-    try:
-        if _PADDLE_AVAILABLE:
-            img = Image.new('RGB', (64, 64), color='white')
-            threading.Thread(target=lambda: run_paddle_ocr_with_timeout(img, seconds=20.0), daemon=True).start()
-    except Exception as e:
-        print("[Warmup Error]", e)
+    tag_vocabulary.start_background_refresh()
+    if MODEL_LOAD_MODE != "lazy":
+        threading.Thread(target=models.load_all, daemon=True).start()
+        if ocr_pool is not None:
+            ocr_pool.start()
@@ -0,0 +1,131 @@
+"""Single place where models are loaded.
+
+Each model is registered with a loader and loaded exactly once, either
+eagerly (all models in parallel) or lazily on first use. Load time and
+memory are recorded per model and reported through ``/health``.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux /proc, 0.0 elsewhere)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except Exception:
+        pass
+    return 0.0
+
+
+def memory_breakdown_mb():
+    """RSS split into shared and private pages, plus PSS (Linux ``smaps_rollup``; empty elsewhere).
+    Under ``serve.py`` the model weights inherited from the parent show up as shared.
+    """
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+              "Private_Clean": "private", "Private_Dirty": "private"}
+    out = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key = line.split(":")[0]
+                if key in fields:
+                    out[fields[key]] = out.get(fields[key], 0.0) + int(line.split()[1]) / 1024.0
+    except Exception:
+        return {}
+    return {k: round(v, 1) for k, v in out.items()}
+
+
+def _tensor_mb(obj):
+    """Parameter + buffer size of a torch module (or a tuple containing one), in MB."""
+    items = obj if isinstance(obj, (tuple, list)) else (obj,)
+    total = 0
+    for item in items:
+        if hasattr(item, "parameters") and hasattr(item, "buffers"):
+            for t in list(item.parameters()) + list(item.buffers()):
+                total += t.numel() * t.element_size()
+    return total / (1024.0 * 1024.0) if total else None
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self._info = {}
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._info[name] = {"loaded": False, "load_seconds": None, "rss_delta_mb": None,
+                            "weights_mb": None, "error": None}
+
+    def names(self):
+        return list(self._loaders.keys())
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def get(self, name):
+        """Return the model, loading it on first use."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._locks[name]:
+            if name not in self._models:
+                self._load(name)
+            return self._models[name]
+
+    def _load(self, name):
+        print(f"Loading {name} model...")
+        rss_before = current_rss_mb()
+        t0 = time.perf_counter()
+        try:
+            model = self._loaders[name]()
+        except Exception as e:
+            self._info[name]["error"] = str(e)
+            print(f"[Model Load Error] {name}: {e}")
+            raise
+        info = self._info[name]
+        info["loaded"] = True
+        info["error"] = None
+        info["load_seconds"] = round(time.perf_counter() - t0, 2)
+        # RSS delta is approximate when several models load in parallel
+        info["rss_delta_mb"] = round(current_rss_mb() - rss_before, 1)
+        weights = _tensor_mb(model)
+        info["weights_mb"] = round(weights, 1) if weights else None
+        self._models[name] = model
+        print(f"✅ {name} loaded in {info['load_seconds']}s")
+
+    def load_all(self, names=None, parallel=True):
+        """Load the given (default: all) models, in parallel threads when ``parallel``."""
+        pending = [n for n in (names or self.names()) if not self.is_loaded(n)]
+        if not pending:
+            return
+
+        def _safe_get(name):
+            try:
+                self.get(name)
+            except Exception:
+                pass
+
+        if parallel and len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="model-load") as pool:
+                list(pool.map(_safe_get, pending))
+        else:
+            for name in pending:
+                _safe_get(name)
+
+    def all_loaded(self, names=None):
+        return all(self.is_loaded(n) for n in (names or self.names()))
+
+    def stats(self):
+        return {
+            "models": {name: dict(info) for name, info in self._info.items()},
+            "rss_mb": round(current_rss_mb(), 1),
+            "pid": os.getpid(),
+        }
@@ -0,0 +1,214 @@
+"""OCR engine registry.
+
+Every engine implements ``recognize(rgb, **options) -> OCRResult`` over an
+HxWx3 uint8 RGB array and returns line-level boxes, text and a 0-1
+confidence. Engines are built once per configuration by ``get_engine`` and
+reused, so model weights are never reloaded per call.
+
+``OCR_ENGINES`` (e.g. ``"paddleocr,easyocr,tesseract"``) is an ordered
+fallback chain: ``run_chain`` tries each engine in turn and returns the
+first result that still has text after that engine's confidence filter.
+"""
+import importlib.util
+import os
+import threading
+import time
+from typing import List, NamedTuple
+
+import numpy as np
+
+OCR_ENGINES = os.getenv("OCR_ENGINES", "paddleocr")
+
+
+class OCRLine(NamedTuple):
+    box: list          # four [x, y] corners, clockwise from top-left
+    text: str
+    confidence: float  # 0-1
+
+
+class OCRResult:
+    def __init__(self, engine: str, lines: List[OCRLine], elapsed_ms: float = 0.0):
+        self.engine = engine
+        self.lines = lines
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def text(self) -> str:
+        return " ".join(line.text for line in self.lines)
+
+    def filtered(self, min_confidence=0.0, min_length=1) -> "OCRResult":
+        lines = [l for l in self.lines if l.confidence >= min_confidence and len(l.text.strip()) >= min_length]
+        return OCRResult(self.engine, lines, self.elapsed_ms)
+
+    def to_dict(self):
+        return {
+            "engine": self.engine,
+            "text": self.text,
+            "lines": [{"box": l.box, "text": l.text, "confidence": round(l.confidence, 4)} for l in self.lines],
+            "elapsed_ms": round(self.elapsed_ms, 1),
+        }
+
+
+class OCREngine:
+    name = ""
+    module = ""             # import name used to check availability
+    min_confidence = 0.4    # default filter applied by run_chain
+
+    def __init__(self, **config):
+        self.config = config
+        self._model = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def available(cls) -> bool:
+        return importlib.util.find_spec(cls.module) is not None
+
+    def load(self):
+        """Build the underlying model once; safe to call repeatedly."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._build()
+        return self._model
+
+    def _build(self):
+        raise NotImplementedError
+
+    def recognize(self, rgb: np.ndarray, **options) -> OCRResult:
+        t0 = time.perf_counter()
+        lines = self._recognize(self.load(), rgb, **options)
+        return OCRResult(self.name, lines, (time.perf_counter() - t0) * 1000.0)
+
+    def _recognize(self, model, rgb, **options) -> List[OCRLine]:
+        raise NotImplementedError
+
+
+class PaddleEngine(OCREngine):
+    name = "paddleocr"
+    module = "paddleocr"
+    min_confidence = 0.4
+
+    def _build(self):
+        # Stable 2.x API; CPU by default to avoid GPU/paddlex issues
+        from paddleocr import PaddleOCR
+        return PaddleOCR(use_angle_cls=True, lang=self.config.get("lang", "en"),
+                         use_gpu=self.config.get("use_gpu", False), show_log=False)
+
+    def _recognize(self, model, rgb, cls=True, **options):
+        result = model.ocr(rgb, cls=cls)
+        if not result or not result[0]:
+            return []
+        return [OCRLine([[float(x), float(y)] for x, y in box], text, float(conf))
+                for box, (text, conf) in result[0]]
+
+
+class EasyOCREngine(OCREngine):
+    name = "easyocr"
+    module = "easyocr"
+    min_confidence = 0.3
+
+    def _build(self):
+        import easyocr
+        gpu = self.config.get("gpu")
+        if gpu is None:
+            import torch
+            gpu = torch.cuda.is_available()
+        return easyocr.Reader(list(self.config.get("langs", ("en",))), gpu=gpu)
+
+    def _recognize(self, model, rgb, **options):
+        options.setdefault("detail", 1)
+        options.setdefault("paragraph", False)
+        return [OCRLine([[float(x), float(y)] for x, y in box], text, float(conf))
+                for box, text, conf in model.readtext(rgb, **options)]
+
+
+class TesseractOCREngine(OCREngine):
+    name = "tesseract"
+    module = "pytesseract"
+    min_confidence = 0.4
+
+    def _build(self):
+        import pytesseract
+        pytesseract.get_tesseract_version()  # fail fast when the binary is missing
+        return pytesseract
+
+    def _recognize(self, model, rgb, psm=6, **options):
+        data = model.image_to_data(rgb, config=f"--oem 3 --psm {psm}", output_type=model.Output.DICT)
+        lines = {}
+        for i, word in enumerate(data["text"]):
+            conf = float(data["conf"][i])
+            word = (word or "").strip()
+            if not word or conf < 0:
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            x, y, w, h = data["left"][i], data["top"][i], data["width"][i], data["height"][i]
+            entry = lines.setdefault(key, {"words": [], "confs": [], "x0": x, "y0": y, "x1": x + w, "y1": y + h})
+            entry["words"].append(word)
+            entry["confs"].append(conf / 100.0)
+            entry["x0"], entry["y0"] = min(entry["x0"], x), min(entry["y0"], y)
+            entry["x1"], entry["y1"] = max(entry["x1"], x + w), max(entry["y1"], y + h)
+        return [
+            OCRLine([[e["x0"], e["y0"]], [e["x1"], e["y0"]], [e["x1"], e["y1"]], [e["x0"], e["y1"]]],
+                    " ".join(e["words"]), sum(e["confs"]) / len(e["confs"]))
+            for _, e in sorted(lines.items())
+        ]
+
+
+ENGINES = {cls.name: cls for cls in (PaddleEngine, EasyOCREngine, TesseractOCREngine)}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_engine(name: str, **config) -> OCREngine:
+    """Shared engine instance for ``name`` and ``config`` (model built on first ``recognize``)."""
+    if name not in ENGINES:
+        raise ValueError(f"unknown OCR engine {name!r}; choose from {sorted(ENGINES)}")
+    key = (name, tuple(sorted(config.items())))
+    with _instances_lock:
+        engine = _instances.get(key)
+        if engine is None:
+            engine = _instances[key] = ENGINES[name](**config)
+    return engine
+
+
+def parse_chain(spec: str = OCR_ENGINES) -> List[str]:
+    """Installed engines from a comma-separated chain, in order."""
+    names = [n.strip().lower() for n in (spec or "").split(",") if n.strip()]
+    unknown = [n for n in names if n not in ENGINES]
+    if unknown:
+        print("[OCR Engines] ignoring unknown engines:", unknown)
+    return [n for n in names if n in ENGINES and ENGINES[n].available()]
+
+
+def load_chain(names: List[str]) -> List[OCREngine]:
+    """Build and warm up every engine in the chain; engines that fail to load are skipped."""
+    engines = []
+    blank = np.full((64, 64, 3), 255, dtype=np.uint8)
+    for name in names:
+        engine = get_engine(name)
+        try:
+            engine.recognize(blank)
+            engines.append(engine)
+        except Exception as e:
+            print(f"[OCR Engines] {name} unavailable:", e)
+    if not engines:
+        raise RuntimeError(f"no OCR engine could be loaded from {names}")
+    return engines
+
+
+def run_chain(engines: List[OCREngine], rgb: np.ndarray, min_length=3) -> dict:
+    """First engine result with text left after filtering, as a dict with an ``attempts`` list."""
+    attempts = []
+    result = None
+    for engine in engines:
+        try:
+            result = engine.recognize(rgb).filtered(engine.min_confidence, min_length)
+        except Exception as e:
+            attempts.append({"engine": engine.name, "error": repr(e)})
+            continue
+        attempts.append({"engine": engine.name, "lines": len(result.lines), "ms": round(result.elapsed_ms, 1)})
+        if result.lines:
+            break
+    out = result.to_dict() if result is not None else {"engine": None, "text": "", "lines": [], "elapsed_ms": 0.0}
+    out["attempts"] = attempts
+    return out
@@ -0,0 +1,296 @@
+"""Persistent pool of OCR worker processes.
+
+Each worker is a spawned process that builds its own OCR engines once and
+then serves jobs over a pipe, so a slow or stuck OCR call never shares
+state with other requests. Jobs wait in a bounded queue (``submit`` raises
+``OCRQueueFull`` when it is full) and carry a deadline measured from
+submission: a job still queued at its deadline is dropped, and a worker
+still running at the deadline is killed and replaced.
+
+From the event loop, ``await pool.run(payload)``. Inside ``bind_slots``
+(e.g. one ``/ocr/batch`` request) it first waits for a free slot, so a burst
+of uploads never overflows the queue or spends its deadline queued.
+
+One dispatcher thread per worker feeds it jobs and resolves the
+``Future`` returned by ``submit``. A job whose future was cancelled while
+queued (e.g. its client disconnected) is skipped without running.
+"""
+import asyncio
+import contextvars
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from contextlib import contextmanager
+
+
+class OCRQueueFull(Exception):
+    pass
+
+
+class OCRTimeout(Exception):
+    pass
+
+
+_slots = contextvars.ContextVar("ocr_slots", default=None)
+
+
+@contextmanager
+def bind_slots(semaphore: asyncio.Semaphore):
+    """Make ``OCRWorkerPool.run`` calls in this context (and tasks started from it) share ``semaphore``."""
+    token = _slots.set(semaphore)
+    try:
+        yield semaphore
+    finally:
+        _slots.reset(token)
+
+
+def _worker_main(conn, init_fn, run_fn):
+    try:
+        engine = init_fn()
+    except Exception as e:
+        conn.send(("init_error", repr(e)))
+        return
+    conn.send(("ready", None))
+    while True:
+        try:
+            payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        try:
+            conn.send(("ok", run_fn(engine, payload)))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+
+class _Job:
+    __slots__ = ("payload", "future", "submitted", "deadline")
+
+    def __init__(self, payload, timeout):
+        self.payload = payload
+        self.future = Future()
+        self.submitted = time.monotonic()
+        self.deadline = self.submitted + timeout
+
+
+class OCRWorkerPool:
+    def __init__(self, name, init_fn, run_fn, size=2, queue_size=16, timeout=10.0, startup_timeout=300.0):
+        """``init_fn()`` builds the engine inside the worker and ``run_fn(engine, payload)`` serves one job.
+        Both must be picklable (module-level functions or ``functools.partial`` of them).
+        """
+        self.name = name
+        self.size = max(1, int(size))
+        self.timeout = float(timeout)
+        self.init_fn = init_fn
+        self.run_fn = run_fn
+        self.startup_timeout = float(startup_timeout)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._started_at = None
+        # Metrics
+        self.ready_workers = 0
+        self.busy_workers = 0
+        self.busy_seconds = 0.0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.expired_in_queue = 0
+        self.cancelled = 0
+        self.recycles = 0
+        self.init_failures = 0
+        self.max_queue_depth = 0
+        self.dequeued = 0
+        self.avg_queue_wait_ms = 0.0
+        self.max_queue_wait_ms = 0.0
+        self.avg_run_ms = 0.0
+
+    def start(self):
+        # Started lazily (or from the startup hook) so workers belong to the serving process
+        with self._start_lock:
+            if self._threads:
+                return
+            self._started_at = time.monotonic()
+            for i in range(self.size):
+                t = threading.Thread(target=self._dispatch, args=(i,), name=f"{self.name}-dispatch-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, payload, timeout=None) -> Future:
+        """Queue one job; raises ``OCRQueueFull`` instead of waiting when the queue is full."""
+        self.start()
+        job = _Job(payload, self.timeout if timeout is None else float(timeout))
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise OCRQueueFull(f"{self.name}: {self._queue.maxsize} jobs already queued")
+        with self._stats_lock:
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return job.future
+
+    async def run(self, payload, timeout=None):
+        """Await one job's result; waits for a slot first when a semaphore is bound with ``bind_slots``."""
+        slots = _slots.get()
+        if slots is None:
+            return await asyncio.wrap_future(self.submit(payload, timeout))
+        async with slots:
+            return await asyncio.wrap_future(self.submit(payload, timeout))
+
+    def _spawn(self, index):
+        """Start a worker and wait until its engine is built; returns ``(process, conn)`` or None."""
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_worker_main, args=(child_conn, self.init_fn, self.run_fn),
+                                 name=f"{self.name}-worker-{index}", daemon=True)
+        try:
+            proc.start()
+        except Exception as e:
+            print(f"[OCR Pool {self.name}] worker {index} could not be started: {e!r}")
+            parent_conn.close()
+            child_conn.close()
+            with self._stats_lock:
+                self.init_failures += 1
+            return None
+        child_conn.close()
+        status, detail = "timeout", None
+        if parent_conn.poll(self.startup_timeout):
+            try:
+                status, detail = parent_conn.recv()
+            except EOFError:
+                status, detail = "init_error", "worker exited during startup"
+        if status == "ready":
+            return proc, parent_conn
+        print(f"[OCR Pool {self.name}] worker {index} failed to start: {status} {detail or ''}")
+        self._kill(proc, parent_conn)
+        with self._stats_lock:
+            self.init_failures += 1
+        return None
+
+    @staticmethod
+    def _kill(proc, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        if proc.is_alive():
+            proc.kill()
+        proc.join(timeout=5)
+
+    @staticmethod
+    def _resolve(future, value=None, error=None):
+        # A dispatcher must outlive any one job, whatever state its future is in
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+        except InvalidStateError:
+            pass
+
+    def _dispatch(self, index):
+        worker = None
+        while True:
+            if worker is None:
+                worker = self._spawn(index)
+                if worker is None:
+                    time.sleep(5.0)
+                    continue
+                with self._stats_lock:
+                    self.ready_workers += 1
+            proc, conn = worker
+
+            job = self._queue.get()
+            if not job.future.set_running_or_notify_cancel():
+                with self._stats_lock:
+                    self.cancelled += 1
+                continue
+            started = time.monotonic()
+            wait_ms = (started - job.submitted) * 1000.0
+            with self._stats_lock:
+                self.dequeued += 1
+                self.avg_queue_wait_ms = wait_ms if self.dequeued == 1 else 0.9 * self.avg_queue_wait_ms + 0.1 * wait_ms
+                self.max_queue_wait_ms = max(self.max_queue_wait_ms, wait_ms)
+            if started >= job.deadline:
+                with self._stats_lock:
+                    self.expired_in_queue += 1
+                    self.timeouts += 1
+                self._resolve(job.future, error=OCRTimeout(f"expired after {wait_ms:.0f} ms in queue"))
+                continue
+
+            with self._stats_lock:
+                self.busy_workers += 1
+            failure, recycle = None, False
+            try:
+                conn.send(job.payload)
+                if conn.poll(max(0.0, job.deadline - time.monotonic())):
+                    status, value = conn.recv()
+                    if status == "ok":
+                        self._resolve(job.future, value)
+                    else:
+                        failure = RuntimeError(value)
+                else:
+                    failure = OCRTimeout(f"no result within {(job.deadline - job.submitted):.1f} s")
+                    recycle = True
+            except (EOFError, OSError) as e:
+                failure = RuntimeError(f"worker died: {e!r}")
+                recycle = True
+            except Exception as e:
+                # e.g. an unpicklable payload: fail the job, keep the worker
+                failure = e
+            elapsed = time.monotonic() - started
+            with self._stats_lock:
+                self.busy_workers -= 1
+                self.busy_seconds += elapsed
+                if failure is None:
+                    self.completed += 1
+                    run_ms = elapsed * 1000.0
+                    self.avg_run_ms = run_ms if self.completed == 1 else 0.9 * self.avg_run_ms + 0.1 * run_ms
+                elif isinstance(failure, OCRTimeout):
+                    self.timeouts += 1
+                else:
+                    self.errors += 1
+                if recycle:
+                    self.recycles += 1
+                    self.ready_workers -= 1
+            if failure is not None:
+                self._resolve(job.future, error=failure)
+            if recycle:
+                # The only way to stop a stuck OCR call is to stop its process
+                self._kill(proc, conn)
+                worker = None
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        with self._stats_lock:
+            return {
+                "workers": self.size,
+                "ready_workers": self.ready_workers,
+                "busy_workers": self.busy_workers,
+                "utilization": round(self.busy_seconds / (uptime * self.size), 3) if uptime else 0.0,
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "max_queue_depth": self.max_queue_depth,
+                "avg_queue_wait_ms": round(self.avg_queue_wait_ms, 1),
+                "max_queue_wait_ms": round(self.max_queue_wait_ms, 1),
+                "avg_run_ms": round(self.avg_run_ms, 1),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "expired_in_queue": self.expired_in_queue,
+                "cancelled": self.cancelled,
+                "errors": self.errors,
+                "recycles": self.recycles,
+                "init_failures": self.init_failures,
+                "timeout_s": self.timeout,
+            }
@@ -0,0 +1,33 @@
+"""Dominant text orientation via Tesseract OSD.
+
+OSD runs once on a downscaled grayscale copy and reports how far the page
+is rotated, so recognition can run at that single angle instead of sweeping
+all four. Photos with too little text make OSD fail or report a low
+confidence; callers then fall back to the sweep.
+"""
+import os
+
+import pytesseract
+from PIL import Image
+
+OSD_MAX_SIDE = 1024
+# Tesseract's orientation confidence is unbounded; ~2 and above is reliable in practice
+ORIENTATION_MIN_CONFIDENCE = float(os.getenv("ORIENTATION_MIN_CONFIDENCE", "2.0"))
+
+
+def estimate_orientation(image: Image.Image):
+    """``(rotate, confidence, error)``: degrees to rotate clockwise to make the text upright."""
+    gray = image.convert("L")
+    if max(gray.size) > OSD_MAX_SIDE:
+        gray.thumbnail((OSD_MAX_SIDE, OSD_MAX_SIDE), Image.BICUBIC)
+    try:
+        osd = pytesseract.image_to_osd(gray, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        # Typically "Too few characters" on photos with little text, or missing osd.traineddata
+        return None, 0.0, str(e).strip().splitlines()[-1] if str(e).strip() else repr(e)
+    return int(osd.get("rotate", 0)) % 360, float(osd.get("orientation_conf", 0.0)), None
+
+
+def upright(image: Image.Image, rotate: int) -> Image.Image:
+    # PIL rotates counter-clockwise
+    return image.rotate(-rotate, expand=True) if rotate else image
@@ -1,28 +1,21 @@
-
-from paddleocr import PaddleOCR
 from PIL import Image
 import numpy as np
 
-# Load once at module level
-ocr_model = PaddleOCR(use_angle_cls=True, lang='en', use_gpu=True)
+from ocr_engines import get_engine
 
-def paddle_ocr(image: Image.Image) -> str:
-    img_array = np.array(image.convert("RGB"))
 
-    result = ocr_model.ocr(img_array, cls=True)
+def paddle_ocr(image: Image.Image) -> str:
+    # Shared engine: the model is built on the first call and reused
+    result = get_engine("paddleocr").recognize(np.array(image.convert("RGB")))
 
-    if not result or not result[0]:
+    if not result.lines:
         print("🚫 No text found by PaddleOCR")
         return ""
 
     print("=== PaddleOCR Results ===")
-    lines = []
-    for line in result[0]:
-        box, (text, conf) = line
-        print(f"Text: {text} | Conf: {conf:.2f}")
-        if len(text.strip()) >= 3 and conf >= 0.4:
-            lines.append(text)
+    for line in result.lines:
+        print(f"Text: {line.text} | Conf: {line.confidence:.2f}")
 
-    final = " ".join(lines)
+    final = result.filtered(min_confidence=0.4, min_length=3).text
     print("✅ Final OCR:", final)
     return final
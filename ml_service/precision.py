@@ -0,0 +1,24 @@
+"""Inference precision modes for the torch models.
+
+- ``fp32``: reference weights, unchanged.
+- ``int8``: dynamic quantization of every ``nn.Linear`` (weights stored as
+  int8, activations quantized on the fly). CPU only; on GPU the model is
+  left in fp32.
+
+Use ``quality_check.py`` to measure what a mode costs against fp32.
+"""
+import torch
+
+PRECISIONS = ("fp32", "int8")
+
+
+def apply_precision(model, precision, device):
+    precision = (precision or "fp32").lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"unknown inference precision {precision!r} (expected one of {PRECISIONS})")
+    if precision == "int8":
+        if str(device) != "cpu":
+            print(f"[Precision] int8 dynamic quantization is CPU-only; keeping fp32 on {device}")
+            return model
+        return torch.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
@@ -0,0 +1,187 @@
+"""Compare a reduced-precision inference mode against the fp32 baseline.
+
+Runs BLIP captioning, CLIP image embedding and zero-shot tagging over the
+sample images with both fp32 and the candidate precision, then reports
+caption agreement, tag agreement, embedding cosine similarity and latency.
+
+Usage (from ml_service/ with its requirements installed; in the container
+mount or copy the images and pass --images):
+    python quality_check.py --precision int8
+    python quality_check.py --precision int8 --images ../sample_images --out int8_report.json
+
+Exits with status 1 when the mean embedding cosine or the tag agreement
+falls below the given thresholds, so it can gate a config change.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import torch
+from PIL import Image
+from transformers import CLIPProcessor, CLIPModel, BlipProcessor, BlipForConditionalGeneration
+
+from label_embeddings import LabelEmbeddingStore
+from precision import apply_precision, PRECISIONS
+from vocabulary import normalize_label
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except Exception as _heif_err:
+    print("[HEIC] pillow-heif not available:", _heif_err)
+
+HF_CACHE = os.getenv("TRANSFORMERS_CACHE", "/root/.cache/huggingface")
+CLIP_MODEL_ID = "openai/clip-vit-base-patch32"
+BLIP_MODEL_ID = "Salesforce/blip-image-captioning-large"
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LABELS = [
+    "wallet", "phone", "smartphone", "key", "keyring", "umbrella", "hat", "pen", "charger",
+    "credit card", "shoe", "glasses", "bag", "backpack", "passport", "boarding pass", "laptop",
+]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".heic")
+
+
+def collect_images(images_dir):
+    paths = [p for p in sorted(glob.glob(os.path.join(images_dir, "*")))
+             if p.lower().endswith(IMAGE_EXTENSIONS)]
+    extra = os.path.join(HERE, "test.jpg")
+    if os.path.exists(extra):
+        paths.append(extra)
+    return paths
+
+
+def load_models(precision, device):
+    clip_model = CLIPModel.from_pretrained(CLIP_MODEL_ID, cache_dir=HF_CACHE)
+    clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_ID, cache_dir=HF_CACHE)
+    blip_processor = BlipProcessor.from_pretrained(BLIP_MODEL_ID, cache_dir=HF_CACHE)
+    blip_model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_ID, cache_dir=HF_CACHE)
+    clip_model = apply_precision(clip_model.eval(), precision, device).to(device)
+    blip_model = apply_precision(blip_model.eval(), precision, device).to(device)
+    return {
+        "precision": precision,
+        "clip": (clip_model, clip_processor),
+        "blip": (blip_model, blip_processor),
+        "labels": LabelEmbeddingStore(f"{CLIP_MODEL_ID}@{precision}"),
+    }
+
+
+def run_one(bundle, image, labels, device):
+    clip_model, clip_processor = bundle["clip"]
+    blip_model, blip_processor = bundle["blip"]
+    timings = {}
+    with torch.no_grad():
+        t0 = time.perf_counter()
+        blip_inputs = blip_processor(images=image, return_tensors="pt").to(device)
+        out = blip_model.generate(**blip_inputs, max_new_tokens=30)
+        caption = blip_processor.tokenizer.decode(out[0], skip_special_tokens=True).strip()
+        timings["caption_ms"] = (time.perf_counter() - t0) * 1000.0
+
+        t0 = time.perf_counter()
+        clip_inputs = clip_processor(images=image, return_tensors="pt").to(device)
+        feats = clip_model.get_image_features(**clip_inputs)
+        feats = feats / feats.norm(dim=-1, keepdim=True)
+        timings["clip_ms"] = (time.perf_counter() - t0) * 1000.0
+
+    text_features = bundle["labels"].get(labels, clip_model, clip_processor.tokenizer, device)
+    probs = torch.softmax(feats @ text_features.T, dim=-1).squeeze(0)
+    top = int(torch.argmax(probs).item())
+    return {
+        "caption": caption,
+        "tag": labels[top],
+        "tag_score": float(probs[top].item()),
+        "embedding": feats.squeeze(0).float().cpu(),
+        **timings,
+    }
+
+
+def _jaccard(a, b):
+    sa, sb = set(a.lower().split()), set(b.lower().split())
+    return len(sa & sb) / len(sa | sb) if (sa or sb) else 1.0
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def compare(precision, images_dir, labels, device="cpu"):
+    paths = collect_images(images_dir)
+    if not paths:
+        raise SystemExit(f"no images found in {images_dir}")
+    baseline = load_models("fp32", device)
+    candidate = load_models(precision, device)
+
+    rows = []
+    for path in paths:
+        try:
+            image = Image.open(path).convert("RGB")
+        except Exception as e:
+            print(f"[skip] {os.path.basename(path)}: {e}")
+            continue
+        ref = run_one(baseline, image, labels, device)
+        cand = run_one(candidate, image, labels, device)
+        rows.append({
+            "image": os.path.basename(path),
+            "caption_fp32": ref["caption"],
+            f"caption_{precision}": cand["caption"],
+            "caption_exact": ref["caption"] == cand["caption"],
+            "caption_jaccard": round(_jaccard(ref["caption"], cand["caption"]), 3),
+            "tag_fp32": ref["tag"],
+            f"tag_{precision}": cand["tag"],
+            "tag_agree": ref["tag"] == cand["tag"],
+            "embedding_cosine": round(float(torch.dot(ref["embedding"], cand["embedding"]).item()), 4),
+            "caption_ms": {"fp32": round(ref["caption_ms"], 1), precision: round(cand["caption_ms"], 1)},
+            "clip_ms": {"fp32": round(ref["clip_ms"], 1), precision: round(cand["clip_ms"], 1)},
+        })
+        print(f"{rows[-1]['image']}: cos={rows[-1]['embedding_cosine']} tag_agree={rows[-1]['tag_agree']} "
+              f"caption_jaccard={rows[-1]['caption_jaccard']}")
+
+    summary = {
+        "precision": precision,
+        "images": len(rows),
+        "embedding_cosine_mean": round(_mean([r["embedding_cosine"] for r in rows]), 4),
+        "embedding_cosine_min": min((r["embedding_cosine"] for r in rows), default=0.0),
+        "tag_agreement": round(_mean([1.0 if r["tag_agree"] else 0.0 for r in rows]), 3),
+        "caption_exact_rate": round(_mean([1.0 if r["caption_exact"] else 0.0 for r in rows]), 3),
+        "caption_jaccard_mean": round(_mean([r["caption_jaccard"] for r in rows]), 3),
+        "caption_ms_mean": {
+            "fp32": round(_mean([r["caption_ms"]["fp32"] for r in rows]), 1),
+            precision: round(_mean([r["caption_ms"][precision] for r in rows]), 1),
+        },
+        "clip_ms_mean": {
+            "fp32": round(_mean([r["clip_ms"]["fp32"] for r in rows]), 1),
+            precision: round(_mean([r["clip_ms"][precision] for r in rows]), 1),
+        },
+    }
+    return {"summary": summary, "images": rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--precision", default="int8", choices=[p for p in PRECISIONS if p != "fp32"])
+    parser.add_argument("--images", default=os.path.join(HERE, "..", "sample_images"))
+    parser.add_argument("--labels", default=",".join(DEFAULT_LABELS), help="comma-separated tag vocabulary")
+    parser.add_argument("--out", help="write the full JSON report to this path")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--min-tag-agreement", type=float, default=0.9)
+    args = parser.parse_args(argv)
+
+    labels = list(dict.fromkeys(normalize_label(x) for x in args.labels.split(",") if x.strip()))
+    report = compare(args.precision, args.images, labels)
+    print(json.dumps(report["summary"], indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    s = report["summary"]
+    if s["embedding_cosine_mean"] < args.min_cosine or s["tag_agreement"] < args.min_tag_agreement:
+        print("❌ quality below thresholds")
+        return 1
+    print("✅ quality within thresholds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
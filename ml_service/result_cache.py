@@ -0,0 +1,132 @@
+"""Content-addressed cache of ``/ocr`` results.
+
+Keys are a SHA-256 of the uploaded bytes combined with everything that can
+change the answer (model ids, precision, caption tier, vocabulary
+fingerprint, OCR settings). Results live in an in-memory LRU and,
+optionally, as JSON files in a directory that is trimmed back under a byte
+budget by evicting the least recently used files.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from lru_cache import LRUCache
+
+
+def make_key(contents: bytes, *parts) -> str:
+    h = hashlib.sha256(contents)
+    for part in parts:
+        h.update(b"\0")
+        h.update(str(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_items=256, disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        self.memory = LRUCache(max_items)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = int(disk_max_bytes)
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".json")
+
+    def _disk_entries(self):
+        """(path, size, mtime) for every cached file."""
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def get(self, key):
+        """Return ``(result, tier)`` where tier is "memory" or "disk", or ``(None, None)``."""
+        value = self.memory.get(key)
+        if value is not None:
+            return value, "memory"
+        if not self.disk_dir:
+            return None, None
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                value = json.load(f)
+            os.utime(path)  # mtime doubles as last-access time for eviction
+        except FileNotFoundError:
+            self.disk_misses += 1
+            return None, None
+        except Exception as e:
+            print("[Result Cache] disk read failed:", e)
+            self.disk_misses += 1
+            return None, None
+        self.disk_hits += 1
+        self.memory.put(key, value)
+        return value, "disk"
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = json.dumps(value, separators=(",", ":"))
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(data)
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            with self._disk_lock:
+                self._disk_bytes += len(data) - previous
+                if self._disk_bytes > self.disk_max_bytes:
+                    self._evict()
+        except Exception as e:
+            print("[Result Cache] disk write failed:", e)
+
+    def _evict(self):
+        # Trim to 90% of the budget so eviction scans stay infrequent
+        target = int(self.disk_max_bytes * 0.9)
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.disk_evictions += 1
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def stats(self):
+        stats = {"memory": self.memory.stats()}
+        if self.disk_dir:
+            stats["disk"] = {
+                "dir": self.disk_dir,
+                "bytes": self._disk_bytes,
+                "max_bytes": self.disk_max_bytes,
+                "hits": self.disk_hits,
+                "misses": self.disk_misses,
+                "evictions": self.disk_evictions,
+            }
+        return stats
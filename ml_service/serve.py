@@ -0,0 +1,167 @@
+"""Pre-fork multi-process server for the ML service.
+
+``uvicorn main:app --workers N`` would import ``main`` and load CLIP and
+BLIP in every worker, multiplying RAM by N. This instead:
+
+1. imports ``main`` and loads every registered model once, in the parent,
+   with torch limited to one thread so no OpenMP pool exists at fork time;
+2. runs ``gc.freeze()`` so the collector never writes to the inherited
+   objects, keeping the weights on shared copy-on-write pages;
+3. binds the listening socket and forks ``--workers`` children. Each child
+   sets its own torch intra-op thread count and serves with uvicorn on
+   the shared socket; the kernel spreads connections across them;
+4. supervises the children, respawning any that die, and on SIGTERM/SIGINT
+   stops them all.
+
+``/health`` reports each worker's pid, torch threads and shared vs private
+memory. Every worker has its own micro-batchers, caches and OCR pool;
+``OCR_WORKERS`` is divided among them. Jobs are spooled under ``JOBS_DIR``
+so any worker can answer for any job. The vector index directory is
+shared through file locks. ``/metrics`` reflects whichever worker served
+the scrape, except ``mlsvc_server_requests_in_flight``, which every worker
+reads from a shared slot file (``SERVE_LOAD_FILE``) covering all of them.
+
+Usage (from ml_service/):
+    python serve.py --workers 4
+    python serve.py --workers 4 --threads-per-worker 2 --port 80
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, ""))
+    except ValueError:
+        return default
+
+
+def plan(workers=None, threads_per_worker=None, cores=None):
+    """``(workers, threads_per_worker)``: by default the cores are divided evenly across workers."""
+    cores = cores or os.cpu_count() or 1
+    workers = max(1, workers or 1)
+    threads = threads_per_worker or max(1, cores // workers)
+    return workers, threads
+
+
+def _run_worker(sock, index, threads, args):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    os.environ["SERVE_WORKER_INDEX"] = str(index)
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already fixed once inter-op work has run; the intra-op setting is what matters
+    import uvicorn
+    from main import app
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=_env_int("SERVE_WORKERS", 1))
+    parser.add_argument("--threads-per-worker", type=int, default=_env_int("SERVE_THREADS_PER_WORKER", 0),
+                        help="torch intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--host", default=os.getenv("SERVE_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("SERVE_PORT", 80))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--keep-alive", type=int, default=5)
+    args = parser.parse_args(argv)
+    workers, threads = plan(args.workers, args.threads_per_worker)
+
+    # Settings main.py reads at import: split the OCR processes across workers, share job state
+    ocr_total = _env_int("OCR_WORKERS", 2)
+    os.environ["OCR_WORKERS"] = str(max(1, ocr_total // workers))
+    if workers > 1 and not os.getenv("JOBS_DIR"):
+        os.environ["JOBS_DIR"] = tempfile.mkdtemp(prefix="mlsvc-jobs-")
+    from metrics import SharedSlots
+    load = SharedSlots.create(workers, prefix="mlsvc-load-")
+    os.environ["SERVE_LOAD_FILE"] = load.path
+
+    import torch
+    torch.set_num_threads(1)
+    t0 = time.perf_counter()
+    import main as service
+    if service.DEVICE != "cpu" and workers > 1:
+        # A CUDA context does not survive fork; run one process per GPU instead
+        print(f"[Serve] --workers > 1 needs CPU inference (DEVICE={service.DEVICE})")
+        return 2
+    service.models.load_all()
+    failed = [n for n, info in service.models.stats()["models"].items() if info.get("error")]
+    print(f"[Serve] models loaded in {time.perf_counter() - t0:.1f}s"
+          + (f" (failed: {failed})" if failed else ""))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    gc.collect()
+    gc.freeze()
+
+    children = {}  # pid -> worker index
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(sock, index, threads, args)
+            except BaseException as e:
+                print(f"[Serve] worker {index} crashed:", e)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"[Serve] {workers} worker(s) x {threads} torch thread(s) on {args.host}:{args.port}; "
+          f"OCR processes per worker: {os.environ['OCR_WORKERS']}")
+    for index in range(workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None:
+            continue
+        load.set(index, 0)  # whatever the dead worker had in flight is gone
+        if stopping:
+            continue
+        print(f"[Serve] worker {index} (pid {pid}) exited with status {status}; respawning")
+        time.sleep(1.0)  # avoid a tight crash loop
+        if not stopping:
+            spawn(index)
+    sock.close()
+    os.remove(load.path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
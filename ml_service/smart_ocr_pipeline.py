@@ -1,38 +1,67 @@
+"""EasyOCR pipeline with a single orientation decision, for in-process callers.
+
+No endpoint calls this module: the service's ``/ocr`` path runs OCR in the
+``ocr_pool`` worker processes. ``smart_ocr_pipeline_info`` returns its
+orientation decision and recognition passes (run and saved) to the caller
+so scripts and experiments can log them; nothing is reported by the API.
+"""
 
-import easyocr
 import numpy as np
 from PIL import Image, ImageOps
 
+from ocr_engines import get_engine
+from orientation import estimate_orientation, upright, ORIENTATION_MIN_CONFIDENCE
+
+ALLOWLIST = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 '
+SWEEP_ROTATIONS = [90, 180, 270]  # EasyOCR always tries 0 as well
+
 def enhance_for_small_text(img):
     gray = img.convert("L")
     gray = gray.resize((gray.width * 2, gray.height * 2))
     return ImageOps.autocontrast(gray)
 
 def smart_ocr_pipeline(image: Image.Image) -> str:
-    reader = easyocr.Reader(['en'], gpu=True)
+    return smart_ocr_pipeline_info(image)[0]
+
+def smart_ocr_pipeline_info(image: Image.Image):
+    """Returns ``(text, info)``; ``info`` reports the orientation decision and recognition passes."""
+    # Shared reader: weights are loaded on the first call, not per request
+    engine = get_engine("easyocr")
+
+    # Find the text angle once; sweep all four only when OSD is unsure
+    rotate, confidence, error = estimate_orientation(image)
+    sweep = rotate is None or confidence < ORIENTATION_MIN_CONFIDENCE
+    if not sweep:
+        image = upright(image, rotate)
+    rotation_info = SWEEP_ROTATIONS if sweep else None
+    passes_per_image = 1 + len(SWEEP_ROTATIONS) if sweep else 1
+    info = {
+        "rotate": rotate,
+        "orientation_confidence": round(confidence, 2),
+        "orientation_error": error,
+        "sweep": sweep,
+        "passes": 2 * passes_per_image,
+        "passes_saved": 2 * (len(SWEEP_ROTATIONS) + 1 - passes_per_image),
+    }
 
-    original = np.array(image)
+    original = np.array(image.convert("RGB"))
     enhanced = np.array(enhance_for_small_text(image))
 
-    print("🔍 Running EasyOCR with allowlist and rotation")
+    print(f"🔍 Running EasyOCR with allowlist ({'rotation sweep' if sweep else f'upright after {rotate}° rotation'})")
 
-    results = reader.readtext(
+    results = engine.recognize(
         original,
-        allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 ',
-        rotation_info=[0, 90, 180, 270],
-        detail=1,
-        paragraph=False
-    ) + reader.readtext(
+        allowlist=ALLOWLIST,
+        rotation_info=rotation_info,
+    ).lines + engine.recognize(
         enhanced,
-        allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 ',
-        rotation_info=[0, 90, 180, 270],
-        detail=1,
-        paragraph=False
-    )
+        allowlist=ALLOWLIST,
+        rotation_info=rotation_info,
+    ).lines
 
     if not results:
         print("🚫 No text detected at all")
-        return ""
+        return "", info
 
     print("=== RAW OCR RESULTS ===")
     for r in results:
@@ -42,7 +71,7 @@ def smart_ocr_pipeline(image: Image.Image) -> str:
     filtered = [r for r in results if len(r[1].strip()) >= 3 and r[2] >= 0.2]
     if not filtered:
         print("🚫 All candidates filtered out")
-        return ""
+        return "", info
 
     # Deduplicate
     seen = set()
@@ -54,4 +83,4 @@ def smart_ocr_pipeline(image: Image.Image) -> str:
 
     final_text = " ".join([r[1] for r in deduped])
     print("✅ Final text:", final_text)
-    return final_text
+    return final_text, info
@@ -1,8 +1,8 @@
 
-import easyocr
 import numpy as np
 from PIL import Image
-import cv2
+
+from ocr_engines import get_engine
 
 def box_aspect_ratio(bbox):
     x0, y0 = bbox[0]
@@ -15,10 +15,10 @@ def box_vertical_position(bbox):
     return (bbox[0][1] + bbox[2][1]) / 2
 
 def smart_ocr_zones(image: Image.Image) -> str:
-    reader = easyocr.Reader(['en'], gpu=True)
-    img_array = np.array(image)
+    # Shared reader: weights are loaded on the first call, not per request
+    img_array = np.array(image.convert("RGB"))
 
-    results = reader.readtext(img_array, detail=1)
+    results = get_engine("easyocr").recognize(img_array).lines
 
     print("=== ALL DETECTED BOXES ===")
     for box, text, conf in results:
@@ -0,0 +1,164 @@
+"""Tesseract fallback engine: one ``image_to_data`` pass per preprocessing variant.
+
+Text and confidence are both derived from the same TSV output, so each
+variant costs a single Tesseract process instead of two. Variants are
+preprocessed and recognized on a process pool, cheapest first (Otsu,
+denoised, adaptive), with at most ``max_workers`` of them in flight. Once
+one clears the confidence bar its result is returned and the variants not
+yet started are skipped. A variant that is already running cannot be
+interrupted and finishes in the background. Early stop therefore only saves
+work when ``max_workers`` is smaller than the number of variants.
+
+Workers are started with ``spawn`` so they never inherit the parent's
+model weights or torch thread pools.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image
+
+VARIANTS = ("otsu", "denoised", "adaptive")  # cheapest first
+# fastNlMeansDenoising is roughly quadratic in its search window per pixel; bound the input
+DENOISE_MAX_SIDE = int(os.getenv("TESSERACT_DENOISE_MAX_SIDE", "1280"))
+
+
+def preprocess_variant(gray: np.ndarray, variant: str) -> np.ndarray:
+    if variant == "denoised":
+        h, w = gray.shape[:2]
+        scale = DENOISE_MAX_SIDE / float(max(h, w))
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        return cv2.fastNlMeansDenoising(gray)
+    if variant == "otsu":
+        return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    if variant == "adaptive":
+        return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    raise ValueError(f"unknown variant: {variant}")
+
+
+def text_and_confidence(data: dict):
+    """Rebuild ``image_to_string``-style text and the mean word confidence from ``image_to_data`` output."""
+    blocks = {}
+    confs = []
+    for i, word in enumerate(data.get("text", [])):
+        conf = float(data["conf"][i])
+        if conf > 0:
+            confs.append(conf)
+        word = (word or "").strip()
+        if not word:
+            continue
+        block = (data["block_num"][i], data["par_num"][i])
+        blocks.setdefault(block, {}).setdefault(data["line_num"][i], []).append(word)
+    paragraphs = ["\n".join(" ".join(words) for _, words in sorted(lines.items()))
+                  for _, lines in sorted(blocks.items())]
+    text = "\n\n".join(paragraphs).strip()
+    return text, (sum(confs) / len(confs) if confs else 0.0)
+
+
+def run_variant(gray: np.ndarray, variant: str, psm: int):
+    """Preprocess and recognize one variant; returns ``(text, confidence, variant, ms)``."""
+    t0 = time.perf_counter()
+    processed = preprocess_variant(gray, variant)
+    data = pytesseract.image_to_data(Image.fromarray(processed), config=f"--oem 3 --psm {psm}",
+                                     output_type=pytesseract.Output.DICT)
+    text, conf = text_and_confidence(data)
+    return text, conf, variant, round((time.perf_counter() - t0) * 1000.0, 1)
+
+
+class TesseractEngine:
+    def __init__(self, max_workers=2, confidence_bar=80.0):
+        self.max_workers = max(1, int(max_workers))
+        self.confidence_bar = float(confidence_bar)
+        self._pool = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.early_stops = 0
+        self.variants_run = 0
+        self.variants_skipped = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _reset_pool(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _good_enough(self, result):
+        text, conf = result[0], result[1]
+        return conf >= self.confidence_bar and len(text) >= 2
+
+    def run(self, gray: np.ndarray, psm: int, variants=VARIANTS):
+        """Best ``(text, confidence, variant)`` over ``variants`` plus an info dict.
+        Confidence is Tesseract's 0-100 mean word confidence.
+        """
+        self.runs += 1
+        results, errors = [], []
+        early_stop = False
+        try:
+            pool = self._get_pool()
+            queued = list(variants)
+            pending = set()
+            while queued or pending:
+                # Keep at most one variant per worker in flight so an early stop skips the rest
+                while queued and len(pending) < self.max_workers:
+                    pending.add(pool.submit(run_variant, gray, queued.pop(0), psm))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    try:
+                        results.append(fut.result())
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        errors.append(str(e))
+                if (queued or pending) and any(self._good_enough(r) for r in results):
+                    early_stop = True
+                    self.variants_skipped += len(queued)
+                    break
+        except BrokenProcessPool as e:
+            print("[Tesseract] worker pool broken, running inline:", e)
+            self._reset_pool()
+            done_variants = {r[2] for r in results}
+            for v in variants:
+                if v in done_variants:
+                    continue
+                try:
+                    results.append(run_variant(gray, v, psm))
+                except Exception as err:
+                    errors.append(str(err))
+
+        self.variants_run += len(results)
+        if early_stop:
+            self.early_stops += 1
+        info = {
+            "variants": {r[2]: {"confidence": round(r[1], 1), "ms": r[3]} for r in results},
+            "early_stop": early_stop,
+        }
+        if errors:
+            info["errors"] = errors
+        if not results:
+            return ("", 0.0, "failed"), info
+        # Prefer higher confidence, then longer text
+        best = max(results, key=lambda r: (r[1], len(r[0])))
+        return best[:3], info
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "confidence_bar": self.confidence_bar,
+            "runs": self.runs,
+            "early_stops": self.early_stops,
+            "variants_run": self.variants_run,
+            "variants_skipped": self.variants_skipped,
+        }
@@ -0,0 +1,48 @@
+"""OCRWorkerPool behaviour that /ocr/batch relies on. Run from ml_service/: python -m pytest tests"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr_pool import OCRQueueFull, OCRWorkerPool, bind_slots  # noqa: E402
+
+WORKERS, QUEUE_SIZE, FILES = 2, 4, 12
+
+
+def _init():
+    return None
+
+
+def _run(_engine, payload):
+    time.sleep(0.1)
+    return payload
+
+
+@pytest.fixture
+def pool():
+    return OCRWorkerPool("test", _init, _run, size=WORKERS, queue_size=QUEUE_SIZE, timeout=5.0)
+
+
+async def _analyze_all(pool, slots):
+    async def one(i):
+        with bind_slots(slots):
+            try:
+                return await pool.run(i)
+            except OCRQueueFull as e:
+                return e
+    return await asyncio.gather(*[one(i) for i in range(FILES)])
+
+
+def test_batch_larger_than_queue_completes_with_slots(pool):
+    results = asyncio.run(_analyze_all(pool, asyncio.Semaphore(pool.size)))
+    assert results == list(range(FILES))
+    assert pool.stats()["rejected"] == 0
+
+
+def test_batch_larger_than_queue_overflows_without_slots(pool):
+    results = asyncio.run(_analyze_all(pool, None))
+    assert any(isinstance(r, OCRQueueFull) for r in results)
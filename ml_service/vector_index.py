@@ -0,0 +1,437 @@
+"""In-service nearest-neighbour index for item embeddings.
+
+Vectors live in one contiguous ``[capacity, dim]`` matrix (float32 or
+float16) memory-mapped from ``<dir>/vectors.npy``, so the catalog survives
+restarts and the OS page cache keeps it hot. Row bookkeeping (item id,
+organization, live/deleted) is an append-only JSONL journal replayed on
+load; deletes are tombstones, reclaimed by ``compact()``.
+
+Several processes (``serve.py`` workers) can share one directory. Writers
+serialize on an exclusive ``flock``; readers catch up under a shared one,
+so they never see a compaction half-done. Every operation first replays
+journal lines appended by other processes, and reopens the matrix when
+another process has grown or compacted it, so all workers map the same
+pages.
+
+Search is an exact, batched inner product (embeddings are L2-normalized,
+so this is cosine similarity) over the organization's rows, followed by an
+``argpartition`` top-k. For large catalogs ``ivf_lists > 0`` enables an
+inverted-file mode: rows are bucketed by their nearest k-means centroid
+and a query scores only the ``nprobe`` closest buckets. The centroids are
+saved to ``<dir>/ivf.npz`` by whichever process trains them; the other
+processes and restarts load them instead of re-running k-means.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+DTYPES = {"float32": np.float32, "float16": np.float16}
+SCORE_CHUNK_ROWS = 65536  # bounds the float32 temporary when scoring float16 storage
+
+
+def _kmeans(data, k, iterations=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroid = members.mean(axis=0)
+                centroids[c] = centroid / (np.linalg.norm(centroid) + 1e-12)
+    return centroids
+
+
+class VectorIndex:
+    def __init__(self, path, dim=512, dtype="float32", ivf_lists=0, nprobe=8, ivf_min_rows=20000,
+                 initial_capacity=1024):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {sorted(DTYPES)}")
+        self.path = path
+        self.dim = int(dim)
+        self.dtype = dtype
+        self.ivf_lists = max(0, int(ivf_lists))
+        self.nprobe = max(1, int(nprobe))
+        self.ivf_min_rows = int(ivf_min_rows)
+        self.initial_capacity = max(16, int(initial_capacity))
+        self._lock = threading.RLock()
+        self._flock_depth = 0
+        self._vectors = None     # memmap [capacity, dim]
+        self._count = 0          # rows used (live + deleted)
+        self._ids = []           # row -> item id (str)
+        self._orgs = np.zeros(0, dtype=np.int64)
+        self._live = np.zeros(0, dtype=bool)
+        self._row_of = {}        # item id -> row
+        self._centroids = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._trained_at = 0
+        self._journal_pos = 0     # bytes of the journal applied so far
+        self._file_ids = None     # (vectors, journal, centroids) inodes last loaded
+        self.searches = 0
+        self.avg_search_ms = 0.0
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, self._flocked(fcntl.LOCK_EX):
+            self._load()
+
+    # ---- storage -------------------------------------------------------------------------
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.path, "vectors.npy")
+
+    @property
+    def _journal_path(self):
+        return os.path.join(self.path, "rows.jsonl")
+
+    def _open_vectors(self, capacity, copy_from=None):
+        tmp = self._vectors_path + ".tmp"
+        mm = np.lib.format.open_memmap(tmp, mode="w+", dtype=DTYPES[self.dtype], shape=(capacity, self.dim))
+        if copy_from is not None and len(copy_from):
+            mm[:len(copy_from)] = copy_from
+        mm.flush()
+        del mm
+        os.replace(tmp, self._vectors_path)
+        return np.lib.format.open_memmap(self._vectors_path, mode="r+")
+
+    @property
+    def _lock_path(self):
+        return os.path.join(self.path, ".lock")
+
+    @property
+    def _centroids_path(self):
+        return os.path.join(self.path, "ivf.npz")
+
+    def _inode(self, path):
+        try:
+            return os.stat(path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _current_file_ids(self):
+        return (self._inode(self._vectors_path), self._inode(self._journal_path),
+                self._inode(self._centroids_path))
+
+    def _reset(self):
+        self._vectors = None
+        self._count, self._ids, self._row_of = 0, [], {}
+        self._orgs = np.zeros(0, dtype=np.int64)
+        self._live = np.zeros(0, dtype=bool)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._journal_pos = 0
+
+    def _sync(self):
+        """Catch up with changes made by other processes sharing the directory (call under an ``flock``)."""
+        file_ids = self._current_file_ids()
+        if file_ids[0] != self._file_ids[0] or (file_ids[1] != self._file_ids[1] and self._journal_pos):
+            # Grown or compacted elsewhere (both replace files): remap and replay from the start
+            self._reset()
+            self._load()
+            return
+        if file_ids[1] is not None and os.path.getsize(self._journal_path) > self._journal_pos:
+            self._replay()
+        if file_ids[2] != self._file_ids[2]:
+            self._load_centroids()  # retrained, or dropped, by another process
+        self._file_ids = file_ids
+
+    def _replay(self):
+        with open(self._journal_path, "rb") as f:
+            f.seek(self._journal_pos)
+            chunk = f.read()
+        end = chunk.rfind(b"\n") + 1  # a line still being written is picked up next time
+        added = []
+        for line in chunk[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn line after a crash
+            if entry.get("op") == "add" and entry["row"] < self._vectors.shape[0]:
+                self._apply_add(entry["id"], entry["org"], entry["row"])
+                added.append(entry["row"])
+            elif entry.get("op") == "del":
+                self._apply_delete(entry["id"])
+        self._journal_pos += end
+        if added and self._centroids is not None:
+            # Rows written by another process still need their IVF list
+            rows = np.asarray(added)
+            block = np.asarray(self._vectors[rows], dtype=np.float32)
+            self._assign[rows] = np.argmax(block @ self._centroids.T, axis=1)
+
+    def _load(self):
+        if os.path.exists(self._vectors_path):
+            vectors = np.lib.format.open_memmap(self._vectors_path, mode="r+")
+            if vectors.shape[1] != self.dim or vectors.dtype != DTYPES[self.dtype]:
+                print(f"[Vector Index] {self._vectors_path} is {vectors.dtype}x{vectors.shape[1]}, "
+                      f"expected {self.dtype}x{self.dim}; starting empty")
+                del vectors
+                vectors = None
+                if os.path.exists(self._journal_path):
+                    os.remove(self._journal_path)
+            self._vectors = vectors
+        if self._vectors is None:
+            self._vectors = self._open_vectors(self.initial_capacity)
+        self._grow_meta(self._vectors.shape[0])
+        if os.path.exists(self._journal_path):
+            self._replay()
+        self._file_ids = self._current_file_ids()
+        if not self._load_centroids():
+            self._maybe_train(force=True)
+
+    def _journal(self, entries):
+        data = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries).encode()
+        with open(self._journal_path, "ab") as f:
+            f.write(data)
+        self._journal_pos += len(data)
+        self._file_ids = self._current_file_ids()
+
+    @contextmanager
+    def _flocked(self, mode):
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _exclusive(self):
+        """Thread lock plus an exclusive ``flock`` shared with other processes (re-entrant)."""
+        with self._lock:
+            if self._flock_depth:
+                self._flock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._flock_depth -= 1
+                return
+            with self._flocked(fcntl.LOCK_EX):
+                self._flock_depth = 1
+                try:
+                    self._sync()
+                    yield
+                finally:
+                    self._flock_depth = 0
+
+    def _read_sync(self):
+        """Catch up under a shared ``flock`` so a concurrent compaction is seen whole; caller holds ``_lock``."""
+        if self._flock_depth:
+            return  # already synced under the exclusive lock
+        with self._flocked(fcntl.LOCK_SH):
+            self._sync()
+
+    def _grow_meta(self, capacity):
+        extra = capacity - len(self._orgs)
+        if extra > 0:
+            self._orgs = np.concatenate([self._orgs, np.zeros(extra, dtype=np.int64)])
+            self._live = np.concatenate([self._live, np.zeros(extra, dtype=bool)])
+            self._assign = np.concatenate([self._assign, np.full(extra, -1, dtype=np.int32)])
+
+    def _apply_add(self, item_id, org, row):
+        old = self._row_of.get(item_id)
+        if old is not None:
+            self._live[old] = False
+        while len(self._ids) <= row:
+            self._ids.append(None)
+        self._ids[row] = item_id
+        self._orgs[row] = int(org)
+        self._live[row] = True
+        self._row_of[item_id] = row
+        self._count = max(self._count, row + 1)
+
+    def _apply_delete(self, item_id):
+        row = self._row_of.pop(item_id, None)
+        if row is not None:
+            self._live[row] = False
+        return row is not None
+
+    # ---- mutations -----------------------------------------------------------------------
+    def add(self, items):
+        """Insert or replace ``[(item_id, org_id, embedding), ...]``; returns the number written."""
+        items = list(items)
+        if not items:
+            return 0
+        vecs = np.asarray([v for _, _, v in items], dtype=np.float32).reshape(len(items), -1)
+        if vecs.shape[1] != self.dim:
+            raise ValueError(f"expected {self.dim}-d embeddings, got {vecs.shape[1]}")
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+        with self._exclusive():
+            needed = self._count + len(items)
+            capacity = self._vectors.shape[0]
+            if needed > capacity:
+                while capacity < needed:
+                    capacity *= 2
+                old = self._vectors[:self._count].copy()
+                del self._vectors
+                self._vectors = self._open_vectors(capacity, old)
+                self._grow_meta(capacity)
+            start = self._count
+            self._vectors[start:start + len(items)] = vecs.astype(DTYPES[self.dtype])
+            self._vectors.flush()
+            entries = []
+            for offset, (item_id, org, _) in enumerate(items):
+                row = start + offset
+                self._apply_add(str(item_id), org, row)
+                entries.append({"op": "add", "id": str(item_id), "org": int(org), "row": row})
+            self._journal(entries)
+            if self._centroids is not None:
+                self._assign[start:start + len(items)] = np.argmax(vecs @ self._centroids.T, axis=1)
+            self._maybe_train()
+        return len(items)
+
+    def delete(self, item_ids):
+        with self._exclusive():
+            removed = [str(i) for i in item_ids if self._apply_delete(str(i))]
+            self._journal({"op": "del", "id": i} for i in removed)
+            if self.dead_rows() > max(1000, len(self._row_of) // 4):
+                self.compact()
+        return len(removed)
+
+    def dead_rows(self):
+        return self._count - len(self._row_of)
+
+    def compact(self):
+        """Rewrite the matrix and journal with live rows only."""
+        with self._exclusive():
+            rows = np.flatnonzero(self._live[:self._count])
+            kept = self._vectors[rows].copy() if len(rows) else np.zeros((0, self.dim), dtype=DTYPES[self.dtype])
+            ids = [self._ids[r] for r in rows]
+            orgs = self._orgs[rows].copy()
+            capacity = max(self.initial_capacity, 1 << int(np.ceil(np.log2(max(len(rows), 1) * 1.25 + 1))))
+            del self._vectors
+            self._vectors = self._open_vectors(capacity, kept)
+            self._count, self._ids, self._row_of = 0, [], {}
+            self._orgs = np.zeros(0, dtype=np.int64)
+            self._live = np.zeros(0, dtype=bool)
+            self._assign = np.zeros(0, dtype=np.int32)
+            self._grow_meta(capacity)
+            entries = []
+            for row, (item_id, org) in enumerate(zip(ids, orgs)):
+                self._apply_add(item_id, int(org), row)
+                entries.append({"op": "add", "id": item_id, "org": int(org), "row": row})
+            tmp = self._journal_path + ".tmp"
+            with open(tmp, "w") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            os.replace(tmp, self._journal_path)
+            self._journal_pos = os.path.getsize(self._journal_path)
+            self._file_ids = self._current_file_ids()
+            self._maybe_train(force=True)
+
+    # ---- IVF -----------------------------------------------------------------------------
+    def _maybe_train(self, force=False):
+        live = len(self._row_of)
+        if not self.ivf_lists or live < max(self.ivf_min_rows, self.ivf_lists * 4):
+            had_centroids = self._centroids is not None
+            self._centroids = None
+            if self.ivf_lists and (had_centroids or os.path.exists(self._centroids_path)):
+                self._save_centroids()  # removes them for the other processes too
+            return
+        if not force and self._centroids is not None and live < 2 * self._trained_at:
+            return
+        rows = np.flatnonzero(self._live[:self._count])
+        rng = np.random.default_rng(0)
+        sample = rows if len(rows) <= 50000 else rng.choice(rows, size=50000, replace=False)
+        self._centroids = _kmeans(np.asarray(self._vectors[np.sort(sample)], dtype=np.float32), self.ivf_lists)
+        self._trained_at = live
+        self._assign_all()
+        self._save_centroids()
+
+    def _assign_all(self):
+        for start in range(0, self._count, SCORE_CHUNK_ROWS):
+            block = np.asarray(self._vectors[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            self._assign[start:start + len(block)] = np.argmax(block @ self._centroids.T, axis=1)
+
+    def _save_centroids(self):
+        if self._centroids is None:
+            try:
+                os.remove(self._centroids_path)
+            except FileNotFoundError:
+                pass
+        else:
+            tmp = f"{self._centroids_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, centroids=self._centroids, trained_at=self._trained_at)
+            os.replace(tmp, self._centroids_path)
+        self._file_ids = self._current_file_ids()
+
+    def _load_centroids(self):
+        """Adopt the persisted centroids; False (and exact mode) when there are none for this configuration."""
+        self._centroids = None
+        if not self.ivf_lists:
+            return False
+        try:
+            with np.load(self._centroids_path) as saved:
+                centroids, trained_at = saved["centroids"], int(saved["trained_at"])
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            return False
+        if centroids.shape != (self.ivf_lists, self.dim):
+            return False
+        self._centroids = centroids.astype(np.float32)
+        self._trained_at = trained_at
+        self._assign_all()
+        return True
+
+    # ---- search --------------------------------------------------------------------------
+    def search(self, queries, k=10, org=None, exclude_ids=()):
+        """Top-``k`` ``[(item_id, score), ...]`` per query row, optionally limited to one organization."""
+        t0 = time.perf_counter()
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        q /= np.linalg.norm(q, axis=1, keepdims=True) + 1e-12
+        with self._lock:
+            self._read_sync()
+            n = self._count
+            mask = self._live[:n].copy()
+            if org is not None:
+                mask &= self._orgs[:n] == int(org)
+            for item_id in exclude_ids:
+                row = self._row_of.get(str(item_id))
+                if row is not None:
+                    mask[row] = False
+            if self._centroids is not None:
+                probe = np.argsort(-(q @ self._centroids.T), axis=1)[:, :self.nprobe]
+                # Union of probed lists across the batch keeps the scoring a single matmul
+                mask &= np.isin(self._assign[:n], np.unique(probe))
+            rows = np.flatnonzero(mask)
+            results = [[] for _ in range(len(q))]
+            if len(rows):
+                if self.dtype == "float32" and len(rows) == n:
+                    scores = self._vectors[:n] @ q.T
+                else:
+                    scores = np.concatenate([
+                        np.asarray(self._vectors[rows[i:i + SCORE_CHUNK_ROWS]], dtype=np.float32) @ q.T
+                        for i in range(0, len(rows), SCORE_CHUNK_ROWS)
+                    ])
+                kk = min(int(k), len(rows))
+                for qi in range(len(q)):
+                    col = scores[:, qi]
+                    top = np.argpartition(-col, kk - 1)[:kk]
+                    top = top[np.argsort(-col[top])]
+                    results[qi] = [(self._ids[rows[j]], float(col[j])) for j in top]
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        self.searches += 1
+        self.avg_search_ms = elapsed_ms if self.searches == 1 else 0.9 * self.avg_search_ms + 0.1 * elapsed_ms
+        return results
+
+    def __len__(self):
+        with self._lock:
+            self._read_sync()
+            return len(self._row_of)
+
+    def stats(self):
+        with self._lock:
+            self._read_sync()
+        return {
+            "items": len(self._row_of),
+            "dead_rows": self.dead_rows(),
+            "capacity": int(self._vectors.shape[0]),
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "mode": "ivf" if self._centroids is not None else "exact",
+            "ivf_lists": self.ivf_lists,
+            "nprobe": self.nprobe,
+            "searches": self.searches,
+            "avg_search_ms": round(self.avg_search_ms, 2),
+        }
@@ -0,0 +1,140 @@
+"""In-process cache of the backend tag vocabulary.
+
+The backend serves labels from ``/api/tags/vocabulary``. Instead of fetching
+them on every ``/ocr`` call, the list is kept in memory, revalidated with a
+conditional GET (ETag) once the TTL expires and refreshed in the background.
+The normalized label list is computed once per vocabulary version.
+"""
+import hashlib
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+FALLBACK_LABELS = ["item", "object", "thing"]
+
+
+def normalize_label(lbl: str) -> str:
+    """Normalize basic plural forms and casing."""
+    s = lbl.strip().lower()
+    if s.endswith('ies') and len(s) > 3:
+        return s[:-3] + 'y'
+    if s.endswith('es') and len(s) > 2:
+        return s[:-2]
+    if s.endswith('s') and len(s) > 1:
+        return s[:-1]
+    return s
+
+
+def flatten_labels(raw):
+    """Ensure the vocabulary is a flat list of strings."""
+    flat_labels = []
+    for label in raw or []:
+        if isinstance(label, dict) and 'name' in label:
+            flat_labels.append(label['name'])
+        elif isinstance(label, str):
+            flat_labels.append(label)
+        else:
+            flat_labels.append(str(label))
+    return flat_labels
+
+
+class TagVocabulary:
+    def __init__(self, url, ttl=60.0, timeout=5.0):
+        self.url = url
+        self.ttl = float(ttl)
+        self.timeout = float(timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.version = 0
+        # Content hash of the labels: stable across restarts, unlike the version counter
+        self.fingerprint = "fallback"
+        self._labels = []
+        self._etag = None
+        self._fetched_at = 0.0
+        self._attempted_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._thread = None
+        self.fetches = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def refresh(self):
+        """Revalidate against the backend; returns True when the labels changed."""
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        self._attempted_at = time.monotonic()
+        try:
+            self.fetches += 1
+            resp = self.session.get(self.url, headers=headers, timeout=self.timeout)
+            if resp.status_code == 304:
+                self.not_modified += 1
+                self._fetched_at = time.monotonic()
+                return False
+            resp.raise_for_status()
+            labels = [normalize_label(x) for x in flatten_labels(resp.json())]
+        except Exception as e:
+            self.errors += 1
+            print("[Tag Vocabulary Fetch Error]", e)
+            return False
+        with self._lock:
+            self._etag = resp.headers.get("ETag")
+            self._fetched_at = time.monotonic()
+            if labels == self._labels:
+                return False
+            self._labels = labels
+            self.version += 1
+            self.fingerprint = hashlib.sha1("\n".join(labels).encode("utf-8")).hexdigest()[:16] if labels else "fallback"
+        print(f"[Tag Vocabulary] version {self.version}: {len(labels)} labels")
+        return True
+
+    def _refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def labels(self):
+        """Return the normalized labels, never blocking once a version is loaded."""
+        if self.version == 0:
+            # Not loaded yet: fetch inline, but don't hammer a backend that is down
+            if time.monotonic() - self._attempted_at > min(self.ttl, 5.0):
+                self.refresh()
+        elif time.monotonic() - self._fetched_at > self.ttl:
+            self._refresh_async()
+        return self._labels or list(FALLBACK_LABELS)
+
+    def start_background_refresh(self):
+        """Revalidate every TTL seconds from a daemon thread."""
+        if self._thread is not None:
+            return
+
+        def _loop():
+            while True:
+                self.refresh()
+                time.sleep(self.ttl)
+
+        self._thread = threading.Thread(target=_loop, daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "labels": len(self._labels),
+            "age_seconds": round(time.monotonic() - self._fetched_at, 1) if self._fetched_at else None,
+            "fetches": self.fetches,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+        }